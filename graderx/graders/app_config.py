@@ -1,10 +1,43 @@
+import os
 from pathlib import Path
 
 
 COURSES_DATA_PATH = Path(__file__).parent.joinpath("courses_config.json")
+# The courses config is kept in COURSES_DATA_PATH ("json") or in an sqlite database ("sqlite"),
+# the database is created from COURSES_DATA_PATH and the test case files the first time it's used
+CATALOG_BACKEND = os.environ.get('GRADERX_CATALOG', 'json')
+CATALOG_DB_PATH = Path(os.environ.get('GRADERX_CATALOG_DB', Path(__file__).parent.joinpath('catalog.sqlite3')))
 LAB_GUIDE_FILENAME = 'lab_guide.md'
 MOSS_PATH = Path(__file__).parent.joinpath('moss/submissions')
 
+# Parent of the scratch directories of the grading runs, None uses the system's temporary directory
+GRADING_SCRATCH_PATH = os.environ.get('GRADERX_SCRATCH_DIR')
+
+# Compiled submissions cache, a max size of 0 disables it
+# The path is read from the environment so that the grading worker processes use the same one
+COMPILE_CACHE_PATH = Path(os.environ.get('GRADERX_COMPILE_CACHE_DIR', Path(__file__).parent.joinpath('cache/compile')))
+COMPILE_CACHE_MAX_SIZE = 512 * 1024 * 1024
+
+# Compiled helpers that start the submissions, see stdout_graders/c/lib/launcher.py
+LAUNCHER_BUILD_PATH = Path(__file__).parent.joinpath('cache/launcher')
+
+# Total bytes of the labs' test cases kept in memory by every grading process
+TEST_CASES_CACHE_MAX_SIZE = 256 * 1024 * 1024
+
+# Bytes of stdout a submission may write for a single test case before it's killed,
+# overridden by the lab's output_limit, and characters of a wrong output that are kept in the results
+DEFAULT_OUTPUT_LIMIT = 16 * 1024 * 1024
+RESULT_OUTPUT_MAX_LENGTH = 64 * 1024
+# Outputs of at least this many bytes are compressed in the results store, None disables the compression
+RESULT_OUTPUT_COMPRESSION_MIN_SIZE = 512
+
+# The columns of the grades exported for every submission, in order
+GRADES_COLUMNS = ("id", "grade", "passed_count", "failed_count", "failed_ids", "wall_time", "cpu_time", "max_rss")
+
+# Background grading jobs, jobs of different labs run at the same time while the runs of a lab are serialized
+GRADING_JOBS_WORKERS = int(os.environ.get('GRADERX_GRADING_JOBS_WORKERS', 4))
+MAX_FINISHED_GRADING_JOBS = 100
+
 # Courses config course-related variables
 COURSE_NAME = 'name'
 COURSE_TYPE = 'type'
@@ -16,4 +49,16 @@ LAB_NAME = 'name'
 DISABLE_INTERNET = 'disable_internet'
 LAB_RUNTIME_LIMIT = 'runtime_limit'
 LAB_TEST_CASES = 'test_cases'
-PUBLIC_TEST_CASES = 'public_test_cases'
\ No newline at end of file
+PUBLIC_TEST_CASES = 'public_test_cases'
+# Count and sizes of the lab's test cases, sent instead of the test cases when only a summary is requested
+LAB_TEST_CASES_SUMMARY = 'test_cases_summary'
+LAB_GRADING_WORKERS = 'grading_workers'
+LAB_TEST_CASE_WORKERS = 'test_case_workers'
+LAB_COMPARISON_MODES = 'comparison_modes'
+LAB_FLOAT_TOLERANCE = 'float_tolerance'
+LAB_OUTPUT_LIMIT = 'output_limit'
+# Resource limits enforced on every process started by stdout graders
+LAB_MEMORY_LIMIT = 'memory_limit'
+LAB_CPU_TIME_LIMIT = 'cpu_time_limit'
+LAB_PROCESSES_LIMIT = 'processes_limit'
+LAB_FILE_SIZE_LIMIT = 'file_size_limit'
@@ -0,0 +1,53 @@
+import os
+import stat
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+
+# Permissions of a file written for the first time
+DEFAULT_FILE_MODE = 0o644
+
+
+@contextmanager
+def atomic_replace(path):
+    """
+    Yields the path of an empty temporary file next to path that replaces path when the block ends,
+    so readers (other threads and processes) see either the previous file or the whole new one
+    The temporary file is removed if the block raises, it has the permissions of the file it replaces
+    since mkstemp creates it readable by its owner only
+    """
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        try:
+            os.fchmod(fd, get_file_mode(path))
+        finally:
+            os.close(fd)
+        yield Path(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextmanager
+def atomic_write(path, mode="w", fsync=False):
+    """
+    Yields a file opened with mode whose content replaces path once the block ends (see atomic_replace),
+    fsync flushes it to the disk first
+    """
+    with atomic_replace(path) as tmp_path:
+        with open(tmp_path, mode) as f:
+            yield f
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def get_file_mode(path):
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return DEFAULT_FILE_MODE
@@ -0,0 +1,114 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from ..app_config import COURSE_LABS, LAB_NAME
+from .atomic_files import atomic_write
+
+
+class ConfigStore:
+    """
+    Keeps the parsed content of a json config file in memory,
+    the file is only parsed again when its modification time or size changes
+    (and its content hash shows that it really changed) so that repeated reads cost a single stat call
+    Writes go to a temporary file that replaces the config file so readers never see a partial file
+    The courses are looked up by name and their labs are scanned, SqliteCatalog has the same methods
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._stat_key = None
+        self._content_hash = None
+        self._data = None
+
+    def read(self):
+        """
+        Returns a copy of the config, callers are free to modify it
+        """
+        with self._lock:
+            return copy.deepcopy(self._load())
+
+    def write(self, data):
+        with self._lock:
+            self._write(data)
+
+    def get_course(self, course):
+        """
+        Returns a copy of the course's config or None if there's no such course
+        """
+        with self._lock:
+            return copy.deepcopy(self._load().get(course))
+
+    def get_lab(self, course, lab):
+        """
+        Returns a copy of the lab's config or None if there's no such course or lab
+        """
+        with self._lock:
+            course_data = self._load().get(course)
+            if course_data is None:
+                return None
+            for lab_data in course_data[COURSE_LABS]:
+                if lab_data[LAB_NAME] == lab:
+                    return copy.deepcopy(lab_data)
+            return None
+
+    def put_course(self, course, course_data):
+        with self._lock:
+            config = copy.deepcopy(self._load())
+            config[course] = course_data
+            self._write(config)
+
+    def delete_course(self, course):
+        with self._lock:
+            config = copy.deepcopy(self._load())
+            config.pop(course, None)
+            self._write(config)
+
+    def put_lab(self, course, lab_data, test_cases=None):
+        """
+        Replaces the course's lab that has the same name as lab_data or adds it if there's no such lab
+        test_cases is only used by SqliteCatalog, the test case files are the source of truth here
+        """
+        with self._lock:
+            config = copy.deepcopy(self._load())
+            labs = config[course][COURSE_LABS]
+            for index, current_lab in enumerate(labs):
+                if current_lab[LAB_NAME] == lab_data[LAB_NAME]:
+                    labs[index] = lab_data
+                    break
+            else:
+                labs.append(lab_data)
+            self._write(config)
+
+    def delete_lab(self, course, lab):
+        with self._lock:
+            config = copy.deepcopy(self._load())
+            config[course][COURSE_LABS] = [
+                lab_data for lab_data in config[course][COURSE_LABS] if lab_data[LAB_NAME] != lab]
+            self._write(config)
+
+    def _load(self):
+        stat_key = self.get_stat_key()
+        if stat_key != self._stat_key:
+            content = self.path.read_bytes()
+            content_hash = hashlib.sha256(content).hexdigest()
+            if content_hash != self._content_hash:
+                self._data = json.loads(content)
+                self._content_hash = content_hash
+            self._stat_key = stat_key
+        return self._data
+
+    def _write(self, data):
+        content = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+        with atomic_write(self.path, 'wb', fsync=True) as f:
+            f.write(content)
+        self._data = copy.deepcopy(data)
+        self._content_hash = hashlib.sha256(content).hexdigest()
+        self._stat_key = self.get_stat_key()
+
+    def get_stat_key(self):
+        file_stat = os.stat(self.path)
+        return (file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size)
@@ -0,0 +1,93 @@
+import threading
+import time
+import uuid
+from enum import Enum
+
+
+class JOB_STATUS(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class GradingJob:
+    """
+    Keeps the state of a single grading run that is executed in the background,
+    the grader reports its progress through update_progress while the job is running
+    """
+
+    def __init__(self, course, lab, student=False, options=None):
+        self.id = uuid.uuid4().hex
+        self.course = course
+        self.lab = lab
+        self.student = student
+        self.options = options or {}
+        self.status = JOB_STATUS.QUEUED.value
+        self.done = 0
+        self.total = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self.status = JOB_STATUS.RUNNING.value
+            self.started_at = time.time()
+
+    def update_progress(self, done, total):
+        with self._lock:
+            self.done = done
+            self.total = total
+
+    def finish(self):
+        with self._lock:
+            self.status = JOB_STATUS.DONE.value
+            self.finished_at = time.time()
+            if self.total is not None:
+                self.done = self.total
+
+    def fail(self, error):
+        with self._lock:
+            self.status = JOB_STATUS.FAILED.value
+            self.finished_at = time.time()
+            self.error = str(error) or error.__class__.__name__
+
+    def is_finished(self):
+        return self.status in (JOB_STATUS.DONE.value, JOB_STATUS.FAILED.value)
+
+    def get_elapsed_time(self):
+        if self.started_at is None:
+            return 0
+        end = self.finished_at if self.finished_at is not None else time.time()
+        return round(end - self.started_at, 2)
+
+    def get_eta(self):
+        """
+        Estimates the remaining seconds from the average time taken by the already graded submissions,
+        returns None while there is nothing to estimate from
+        """
+        if self.is_finished():
+            return 0
+        if not self.done or not self.total:
+            return None
+        elapsed = self.get_elapsed_time()
+        return round(elapsed / self.done * (self.total - self.done), 2)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "course": self.course,
+                "lab": self.lab,
+                "student": self.student,
+                "options": self.options,
+                "status": self.status,
+                "done": self.done,
+                "total": self.total,
+                "elapsed": self.get_elapsed_time(),
+                "eta": self.get_eta(),
+                "error": self.error
+            }
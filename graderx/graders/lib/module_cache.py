@@ -0,0 +1,42 @@
+import importlib.util
+import os
+import threading
+
+
+class ModuleCache:
+    """
+    Keeps the python config modules (like the courses' lib/app_config.py) loaded from files,
+    a module is only executed again when the inode, modification time or size of its file changes
+    so that repeated loads cost a single stat call
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._modules = {}
+
+    def load(self, path):
+        """
+        Returns the module of the python file at path, raises FileNotFoundError if there's no such file
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        stat_key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._modules.get(path)
+            if cached is not None and cached[0] == stat_key:
+                return cached[1]
+            spec = importlib.util.spec_from_file_location("module.name", path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            self._modules[path] = (stat_key, module)
+            return module
+
+
+config_modules = ModuleCache()
+
+
+def load_config_module(path):
+    """
+    Returns the config module at path, it's shared by every grader and only reloaded when the file changes
+    """
+    return config_modules.load(path)
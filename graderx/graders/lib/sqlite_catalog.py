@@ -0,0 +1,220 @@
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from ..app_config import COURSE_TYPE, COURSE_VARIANT, COURSE_LABS, LAB_NAME, PUBLIC_TEST_CASES
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS courses (
+    name TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    variant TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS labs (
+    course TEXT NOT NULL REFERENCES courses(name) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (course, name)
+);
+CREATE TABLE IF NOT EXISTS test_cases (
+    course TEXT NOT NULL,
+    lab TEXT NOT NULL,
+    id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    public INTEGER NOT NULL,
+    PRIMARY KEY (course, lab, id),
+    FOREIGN KEY (course, lab) REFERENCES labs(course, name) ON DELETE CASCADE
+);
+"""
+
+
+class SqliteCatalog:
+    """
+    Stores the courses config in an sqlite database, courses, labs and test cases are rows indexed by name
+    so a lab lookup doesn't load the other courses and every update is a transaction on the changed rows only
+    It has the same methods as ConfigStore, read and write still work with the whole courses config dict
+    Every thread gets its own connection, the database is shared safely by several server processes
+    The test cases table only keeps the ids and public flags, their content stays in the test case files
+    """
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._connections = threading.local()
+        self.get_connection().executescript(SCHEMA)
+
+    def get_connection(self):
+        connection = getattr(self._connections, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            self._connections.connection = connection
+        return connection
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs the enclosed statements in a write transaction, it's rolled back if any of them fails
+        """
+        connection = self.get_connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def migrate_json_config(self, json_path, get_lab_path):
+        """
+        One time import of a courses_config json file, the ids of every lab's test cases are taken
+        from its test case files found in get_lab_path(course, lab)/test_cases
+        It does nothing if the catalog was already migrated
+        """
+        with self.transaction() as connection:
+            if connection.execute("SELECT value FROM meta WHERE key = 'migrated'").fetchone() is not None:
+                return
+            config = {}
+            if Path(json_path).exists():
+                with open(json_path) as f:
+                    config = json.load(f)
+            for course, course_data in config.items():
+                self._put_course(connection, course, course_data)
+                for lab_data in course_data[COURSE_LABS]:
+                    test_cases_path = Path(get_lab_path(course, lab_data[LAB_NAME])).joinpath("test_cases")
+                    public_test_cases = set(map(str, lab_data.get(PUBLIC_TEST_CASES) or []))
+                    test_cases = [
+                        {"id": tc_path.name[:-len("_in")], "public": tc_path.name[:-len("_in")] in public_test_cases}
+                        for tc_path in sorted(test_cases_path.glob("*_in"))] if test_cases_path.exists() else None
+                    self._put_test_cases(connection, course, lab_data, test_cases)
+            connection.execute(
+                "INSERT INTO meta (key, value) VALUES ('migrated', ?)", (str(json_path),))
+
+    def read(self):
+        connection = self.get_connection()
+        config = {}
+        for row in connection.execute("SELECT * FROM courses ORDER BY rowid"):
+            config[row["name"]] = self._course_from_row(connection, row)
+        return config
+
+    def write(self, data):
+        """
+        Replaces the whole catalog with the given courses config, the courses and labs that are kept
+        are updated in place so their test cases that aren't public (which aren't in the config) are kept
+        """
+        with self.transaction() as connection:
+            connection.execute(
+                f"DELETE FROM courses WHERE name NOT IN ({', '.join('?' * len(data))})", tuple(data))
+            for course, course_data in data.items():
+                self._put_course(connection, course, course_data)
+
+    def get_course(self, course):
+        connection = self.get_connection()
+        row = connection.execute("SELECT * FROM courses WHERE name = ?", (course,)).fetchone()
+        if row is None:
+            return None
+        return self._course_from_row(connection, row)
+
+    def get_lab(self, course, lab):
+        connection = self.get_connection()
+        row = connection.execute("SELECT * FROM labs WHERE course = ? AND name = ?", (course, lab)).fetchone()
+        if row is None:
+            return None
+        return self._lab_from_row(connection, row)
+
+    def put_course(self, course, course_data):
+        with self.transaction() as connection:
+            self._put_course(connection, course, course_data)
+
+    def delete_course(self, course):
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM courses WHERE name = ?", (course,))
+
+    def put_lab(self, course, lab_data, test_cases=None):
+        """
+        Replaces the course's lab that has the same name as lab_data or adds it if there's no such lab
+        test_cases is a list of {"id", "public"} dicts that replaces the lab's test cases,
+        if it's None the lab's test cases are kept and only their public flags are updated
+        """
+        with self.transaction() as connection:
+            self._put_lab(connection, course, lab_data, test_cases)
+
+    def delete_lab(self, course, lab):
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM labs WHERE course = ? AND name = ?", (course, lab))
+
+    def _course_from_row(self, connection, row):
+        course_data = json.loads(row["data"])
+        course_data[COURSE_TYPE] = row["type"]
+        course_data[COURSE_VARIANT] = row["variant"]
+        course_data[COURSE_LABS] = [
+            self._lab_from_row(connection, lab_row) for lab_row in connection.execute(
+                "SELECT * FROM labs WHERE course = ? ORDER BY position", (row["name"],))]
+        return course_data
+
+    def _lab_from_row(self, connection, row):
+        lab_data = json.loads(row["data"])
+        test_cases = connection.execute(
+            "SELECT id, public FROM test_cases WHERE course = ? AND lab = ? ORDER BY position",
+            (row["course"], row["name"])).fetchall()
+        if test_cases:
+            lab_data[PUBLIC_TEST_CASES] = [tc["id"] for tc in test_cases if tc["public"]]
+        return lab_data
+
+    def _put_course(self, connection, course, course_data):
+        data = {key: value for key, value in course_data.items()
+                if key not in (COURSE_TYPE, COURSE_VARIANT, COURSE_LABS)}
+        connection.execute(
+            "INSERT INTO courses (name, type, variant, data) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET type = excluded.type, variant = excluded.variant, data = excluded.data",
+            (course, course_data[COURSE_TYPE], course_data[COURSE_VARIANT], json.dumps(data)))
+        lab_names = [lab_data[LAB_NAME] for lab_data in course_data[COURSE_LABS]]
+        connection.execute(
+            f"DELETE FROM labs WHERE course = ? AND name NOT IN ({', '.join('?' * len(lab_names))})",
+            (course, *lab_names))
+        for position, lab_data in enumerate(course_data[COURSE_LABS]):
+            self._put_lab(connection, course, lab_data, None, position)
+
+    def _put_lab(self, connection, course, lab_data, test_cases, position=None):
+        if position is None:
+            row = connection.execute(
+                "SELECT position FROM labs WHERE course = ? AND name = ?", (course, lab_data[LAB_NAME])).fetchone()
+            if row is None:
+                row = connection.execute(
+                    "SELECT COALESCE(MAX(position) + 1, 0) AS position FROM labs WHERE course = ?", (course,)).fetchone()
+            position = row["position"]
+        data = {key: value for key, value in lab_data.items() if key != PUBLIC_TEST_CASES}
+        connection.execute(
+            "INSERT INTO labs (course, name, position, data) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (course, name) DO UPDATE SET position = excluded.position, data = excluded.data",
+            (course, lab_data[LAB_NAME], position, json.dumps(data)))
+        self._put_test_cases(connection, course, lab_data, test_cases)
+
+    def _put_test_cases(self, connection, course, lab_data, test_cases):
+        lab = lab_data[LAB_NAME]
+        if test_cases is not None:
+            connection.execute("DELETE FROM test_cases WHERE course = ? AND lab = ?", (course, lab))
+            connection.executemany(
+                "INSERT INTO test_cases (course, lab, id, position, public) VALUES (?, ?, ?, ?, ?)",
+                [(course, lab, str(tc["id"]), position, int(bool(tc["public"])))
+                 for position, tc in enumerate(test_cases)])
+            return
+        # Only the public flags are known, test cases that aren't in the table yet are added after the others
+        public_test_cases = [str(tc_id) for tc_id in lab_data.get(PUBLIC_TEST_CASES) or []]
+        connection.execute("UPDATE test_cases SET public = 0 WHERE course = ? AND lab = ?", (course, lab))
+        for tc_id in public_test_cases:
+            connection.execute(
+                "INSERT INTO test_cases (course, lab, id, position, public) VALUES (?, ?, ?, "
+                "(SELECT COALESCE(MAX(position) + 1, 0) FROM test_cases WHERE course = ? AND lab = ?), 1) "
+                "ON CONFLICT (course, lab, id) DO UPDATE SET public = 1",
+                (course, lab, tc_id, course, lab))
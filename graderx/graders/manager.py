@@ -4,22 +4,63 @@ from .unittest_graders.pytest import pytest_grader
 from pathlib import Path
 from .lib.helpers import create_zip_file, GRADER_TYPES
 import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from .moss import moss
 from .stdout_graders.c.lib import submissions_extraction
+from .stdout_graders.c.lib import compile_submission
 from .stdout_graders.stdout_common import stdout_common
-from .app_config import ( COURSES_DATA_PATH, MOSS_PATH, COURSE_NAME,
+from .stdout_graders.stdout_common.lib.output_comparator import COMPARISON_MODES
+from .app_config import ( COURSES_DATA_PATH, CATALOG_BACKEND, CATALOG_DB_PATH, MOSS_PATH, COURSE_NAME,
     COURSE_TYPE, COURSE_VARIANT, COURSE_LABS, LAB_NAME, 
-    DISABLE_INTERNET, LAB_RUNTIME_LIMIT, LAB_TEST_CASES, PUBLIC_TEST_CASES )
+    DISABLE_INTERNET, LAB_RUNTIME_LIMIT, LAB_TEST_CASES, PUBLIC_TEST_CASES, LAB_TEST_CASES_SUMMARY,
+    LAB_GRADING_WORKERS, LAB_TEST_CASE_WORKERS, LAB_COMPARISON_MODES, LAB_FLOAT_TOLERANCE, LAB_OUTPUT_LIMIT,
+    DEFAULT_OUTPUT_LIMIT, LAB_MEMORY_LIMIT, LAB_CPU_TIME_LIMIT, LAB_PROCESSES_LIMIT, LAB_FILE_SIZE_LIMIT,
+    GRADING_JOBS_WORKERS, MAX_FINISHED_GRADING_JOBS, GRADES_COLUMNS )
 from .moss.comments_remover import CommentsRemover
+from .lib.grading_jobs import GradingJob
+from .lib.config_store import ConfigStore
+from .lib.sqlite_catalog import SqliteCatalog
+
+
+# Grading runs are executed in the background by this executor, the jobs are kept in grading_jobs
+# so that their progress can be polled using their ids
+grading_executor = ThreadPoolExecutor(max_workers=GRADING_JOBS_WORKERS)
+grading_jobs = {}
+grading_jobs_lock = threading.Lock()
+# Runs of the same lab write to the same results files so they wait for each other,
+# different labs are graded at the same time
+# The jobs waiting for another job of their lab are queued here rather than on the executor
+# so that they don't hold a worker, a lab is only in lab_job_queues while one of its jobs is submitted
+lab_job_queues = {}
+# (lock, number of runs holding or waiting for it) of the labs being graded by run_grader
+lab_grading_locks = {}
+
+
+def create_courses_config_store():
+    """
+    Returns the store of the courses config selected by CATALOG_BACKEND,
+    the sqlite catalog is filled from the json config the first time it's used
+    """
+    if CATALOG_BACKEND == 'sqlite':
+        catalog = SqliteCatalog(CATALOG_DB_PATH)
+        catalog.migrate_json_config(COURSES_DATA_PATH, stdout_common.get_lab_path)
+        return catalog
+    # Keeps courses_config in memory, it's read by almost every request
+    return ConfigStore(COURSES_DATA_PATH)
 
 
+courses_config_store = create_courses_config_store()
+
 
 def get_courses_config():
     """
-    Creates a dict out of courses_config json file then returns it
+    Creates a dict out of courses_config json file then returns it,
+    the file is only parsed again when it changes
     """
-    with open(COURSES_DATA_PATH) as f:
-        return json.load(f)
+    return courses_config_store.read()
 
 
 def get_courses_config_if_course_exists(course_name):
@@ -28,27 +69,26 @@ def get_courses_config_if_course_exists(course_name):
         raise CourseNotFoundError
     return courses_config
 
+
+def get_course_object(course):
+    course_object = courses_config_store.get_course(course)
+    if course_object is None:
+        raise CourseNotFoundError
+    return course_object
+
+
 def get_lab_object(course, lab):
-    courses_config = get_courses_config_if_course_exists(course)
-    target_lab_index = -1
-    for i, lab_ in enumerate(courses_config[course]['labs']):
-        if lab_['name'] == lab:
-            target_lab_index = i
-    if target_lab_index == -1:
+    lab_object = courses_config_store.get_lab(course, lab)
+    if lab_object is None:
+        get_course_object(course)
         raise LabNotFoundError
-    return courses_config[course]['labs'][target_lab_index]
+    return lab_object
 
 def update_course_config(course_config_dict):
     """
     Takes a dict and replaces the current courses_config with it
     """
-    with open(COURSES_DATA_PATH, "w") as f:
-        json.dump(course_config_dict, f)
-
-
-def add_new_course_to_current_courses(data):
-    with open(COURSES_DATA_PATH, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    courses_config_store.write(course_config_dict)
 
 
 def create_course(course_name, language, labs):
@@ -56,11 +96,9 @@ def create_course(course_name, language, labs):
     for course in current_courses:
         if course.lower() == course_name.lower():
             return "Course already present", 404
-    current_courses = get_courses_config()
     stdout_common.create_course_dir(course_name)
-    current_courses[course_name] = {
-        COURSE_TYPE: "stdout", COURSE_VARIANT: language.lower(), COURSE_LABS: []}
-    add_new_course_to_current_courses(current_courses)
+    courses_config_store.put_course(course_name, {
+        COURSE_TYPE: "stdout", COURSE_VARIANT: language.lower(), COURSE_LABS: []})
 
 
 def get_courses():
@@ -68,14 +106,14 @@ def get_courses():
 
 
 def get_labs(course_name):
-    return [lab[LAB_NAME] for lab in get_courses_config()[course_name][COURSE_LABS]]
+    return [lab[LAB_NAME] for lab in get_course_object(course_name)[COURSE_LABS]]
 
 
 def select_course_grader(course_name):
     """
     Finds the grader responsible for the given course then returns its main module
     """
-    course_config = get_courses_config()[course_name]
+    course_config = get_course_object(course_name)
     if course_config[COURSE_TYPE] == "stdout":
         if course_config[COURSE_VARIANT] == "c":
             return c_grader
@@ -96,34 +134,256 @@ def get_public_testcases(course, lab):
     else:
         return lab_object['public_test_cases']
 
-def run_grader(course_name, lab, student = False):
+def run_grader(course_name, lab, student = False, progress = None, **options):
     """
     All the possibly returned modules will have a run_grader function that will be invoked here
+    progress is passed to the grader which calls it with (graded submissions count, total submissions count)
+    The lab's grading_workers is the number of processes used by both stdout and unittest graders
+    options are only supported by stdout graders:
+        incremental: re-runs only the submissions and test cases that changed since the last run
+        fail_fast: stops grading a submission at its first failing test case
+        sample_submissions, sample_test_cases: grades only a random subset of that many submissions/test cases
+        sample_seed: seed of the random sampling
+        the results of a sampled run are kept apart, they're read by passing sample=True to the results functions
     """
     course_grader = select_course_grader(course_name)
     lab_object = get_lab_object(course_name, lab)
+    with lab_grading_lock(course_name, lab):
+        run_course_grader(course_grader, course_name, lab, lab_object, student, progress, options)
+
+
+@contextmanager
+def lab_grading_lock(course_name, lab):
+    """
+    Holds the lock of the lab while grading it, the lock is forgotten once no run uses it
+    """
+    key = (course_name, lab)
+    with grading_jobs_lock:
+        lock, users = lab_grading_locks.get(key) or (threading.Lock(), 0)
+        lab_grading_locks[key] = (lock, users + 1)
+    try:
+        with lock:
+            yield
+    finally:
+        with grading_jobs_lock:
+            lock, users = lab_grading_locks[key]
+            if users == 1:
+                del lab_grading_locks[key]
+            else:
+                lab_grading_locks[key] = (lock, users - 1)
+
+
+def run_course_grader(course_grader, course_name, lab, lab_object, student, progress, options):
     runtime_limit = lab_object['runtime_limit']
-    if student:
-        if course_grader.GRADER_TYPE == GRADER_TYPES.UNITTEST:
-            course_grader.run_grader(course_name, lab, student=True)
+    if course_grader.GRADER_TYPE == GRADER_TYPES.UNITTEST.value:
+        validate_grading_options(course_grader, options)
+        course_grader.run_grader(
+            course_name, lab, student=student, progress=progress,
+            workers=lab_object.get(LAB_GRADING_WORKERS, 1))
+    elif student:
+        public_testcases = get_public_testcases(course_name, lab)
+        if public_testcases:
+            course_grader.run_grader(
+                course_name, 
+                lab,
+                runtime_limit=runtime_limit, 
+                public_testcases=public_testcases,
+                progress=progress,
+                **options,
+                **get_stdout_grader_settings(lab_object)
+            )
         else:
-            public_testcases = get_public_testcases(course_name, lab)
-            if public_testcases:
-                course_grader.run_grader(
-                    course_name, 
-                    lab,
-                    runtime_limit=runtime_limit, 
-                    public_testcases=public_testcases
-                )
-            else:
-                raise NoPublicTestcasesError
+            raise NoPublicTestcasesError
     else:
-        course_grader.run_grader(course_name, lab, runtime_limit)
+        course_grader.run_grader(
+            course_name, lab, runtime_limit, progress=progress, **options,
+            **get_stdout_grader_settings(lab_object))
+
+
+def validate_grading_options(course_grader, options):
+    """
+    Raises UnsupportedGradingOptionsError if any of the run_grader options is used with a unittest grader
+    """
+    if course_grader.GRADER_TYPE == GRADER_TYPES.UNITTEST.value and any(options.values()):
+        raise UnsupportedGradingOptionsError
+
+
+def get_stdout_grader_settings(lab_object):
+    """
+    Returns the optional lab settings that are passed to the run_grader function of stdout graders
+    """
+    return {
+        # Number of processes used to grade the submissions in parallel
+        'workers': lab_object.get(LAB_GRADING_WORKERS, 1),
+        # Number of test cases of a single submission that are executed at the same time
+        'test_case_workers': lab_object.get(LAB_TEST_CASE_WORKERS, 1),
+        # Normalisations allowed when comparing the outputs, see output_comparator.COMPARISON_MODES
+        'comparison_modes': lab_object.get(LAB_COMPARISON_MODES, []),
+        'float_tolerance': lab_object.get(LAB_FLOAT_TOLERANCE),
+        # Bytes of stdout a submission may write for a single test case
+        'output_limit': lab_object.get(LAB_OUTPUT_LIMIT, DEFAULT_OUTPUT_LIMIT),
+        # rlimits of every started process, memory and file size in bytes and cpu time in seconds
+        'resource_limits': {
+            limit: lab_object[key] for limit, key in (
+                ('memory', LAB_MEMORY_LIMIT),
+                ('cpu_time', LAB_CPU_TIME_LIMIT),
+                ('processes', LAB_PROCESSES_LIMIT),
+                ('file_size', LAB_FILE_SIZE_LIMIT)) if key in lab_object}
+    }
+
+
+def start_grading_job(course_name, lab, student = False, **options):
+    """
+    Validates that the lab can be graded then queues run_grader on the grading executor,
+    returns the id of the created job without waiting for the grading to finish
+    options are passed as they are to run_grader
+    """
+    get_lab_object(course_name, lab)
+    course_grader = select_course_grader(course_name)
+    validate_grading_options(course_grader, options)
+    if student and course_grader.GRADER_TYPE == GRADER_TYPES.STDOUT.value:
+        if not get_public_testcases(course_name, lab):
+            raise NoPublicTestcasesError
+    job = GradingJob(course_name, lab, student, options)
+    with grading_jobs_lock:
+        remove_finished_grading_jobs()
+        grading_jobs[job.id] = job
+        queue = lab_job_queues.get((course_name, lab))
+        if queue is None:
+            lab_job_queues[(course_name, lab)] = deque()
+            grading_executor.submit(run_grading_job, job)
+        else:
+            queue.append(job)
+    return job.id
+
+
+def run_grading_job(job):
+    job.start()
+    try:
+        run_grader(job.course, job.lab, student=job.student, progress=job.update_progress, **job.options)
+        job.finish()
+    except Exception as e:
+        job.fail(e)
+    finally:
+        submit_next_lab_job(job.course, job.lab)
+
+
+def submit_next_lab_job(course_name, lab):
+    """
+    Submits the oldest queued job of the lab to the executor, or forgets the lab if none is queued
+    """
+    with grading_jobs_lock:
+        queue = lab_job_queues[(course_name, lab)]
+        if queue:
+            grading_executor.submit(run_grading_job, queue.popleft())
+        else:
+            del lab_job_queues[(course_name, lab)]
+
+
+def remove_finished_grading_jobs():
+    """
+    Forgets the oldest finished jobs so that at most MAX_FINISHED_GRADING_JOBS of them are kept
+    """
+    finished_jobs = sorted(
+        filter(lambda job: job.is_finished(), grading_jobs.values()), key=lambda job: job.created_at)
+    for job in finished_jobs[:max(0, len(finished_jobs) - MAX_FINISHED_GRADING_JOBS)]:
+        del grading_jobs[job.id]
+
+
+def get_grading_job(job_id):
+    try:
+        return grading_jobs[job_id].to_dict()
+    except KeyError:
+        raise GradingJobNotFoundError
+
+
+def get_grading_jobs(course_name = None, lab = None):
+    with grading_jobs_lock:
+        jobs = list(grading_jobs.values())
+    if course_name:
+        jobs = filter(lambda job: job.course == course_name, jobs)
+    if lab:
+        jobs = filter(lambda job: job.lab == lab, jobs)
+    return [job.to_dict() for job in sorted(jobs, key=lambda job: job.created_at)]
+
+
+def select_results_grader(course_name, sample=False):
+    """
+    Returns the grader of the course, sample selects the results of the lab's last sampled run
+    which only stdout graders have, ResultsNotFoundError is raised for the other graders
+    """
+    course_grader = select_course_grader(course_name)
+    if sample and course_grader.GRADER_TYPE != GRADER_TYPES.STDOUT.value:
+        raise ResultsNotFoundError
+    return course_grader
+
+
+def get_sample_option(sample):
+    # Only the graders that run samples take the option
+    return {'sample': True} if sample else {}
+
 
+def run_grader_diff(course_name, lab, sample=False):
+    course_grader = select_results_grader(course_name, sample)
+    return course_grader.get_diff_results_file(course_name, lab, **get_sample_option(sample))
 
-def run_grader_diff(course_name, lab):
+
+def get_grades(course_name, lab, sample=False):
+    """
+    All the possibly returned modules will have a get_grades function that returns an iterator of grades rows,
+    dicts with the GRADES_COLUMNS keys
+    Raises ResultsNotFoundError if the lab wasn't graded yet
+    """
+    course_grader = select_results_grader(course_name, sample)
+    try:
+        return course_grader.get_grades(course_name, lab, **get_sample_option(sample))
+    except FileNotFoundError:
+        raise ResultsNotFoundError
+
+
+def get_diff_page(course_name, lab, offset=0, limit=20, submission_id=None, tc_id=None, metadata_only=False,
+                  sample=False):
+    """
+    Returns a page of the diff results of a stdout graded lab filtered by submission id or test case id,
+    raises ResultsNotFoundError if the lab wasn't graded yet
+    """
+    course_grader = select_course_grader(course_name)
+    if course_grader.GRADER_TYPE != GRADER_TYPES.STDOUT.value:
+        raise ResultsNotFoundError
+    try:
+        return course_grader.get_diff_page(
+            course_name, lab, offset, limit, submission_id, tc_id, metadata_only, sample=sample)
+    except FileNotFoundError:
+        raise ResultsNotFoundError
+
+
+def get_failed_case(course_name, lab, submission_id, tc_id, sample=False):
+    """
+    Returns the output and the expected output of a submission's failed test case
+    """
+    course_grader = select_course_grader(course_name)
+    if course_grader.GRADER_TYPE != GRADER_TYPES.STDOUT.value:
+        raise ResultsNotFoundError
+    try:
+        failed_case = course_grader.get_failed_case(course_name, lab, submission_id, tc_id, sample=sample)
+    except FileNotFoundError:
+        raise ResultsNotFoundError
+    if failed_case is None:
+        raise FailedCaseNotFoundError
+    return failed_case
+
+
+def get_failure_clusters(course_name, lab, tc_id=None, sample=False):
+    """
+    Returns the failed test cases of a stdout graded lab grouped by test case and identical wrong output
+    """
     course_grader = select_course_grader(course_name)
-    return course_grader.get_diff_results_file(course_name, lab)
+    if course_grader.GRADER_TYPE != GRADER_TYPES.STDOUT.value:
+        raise ResultsNotFoundError
+    try:
+        return course_grader.get_failure_clusters(course_name, lab, tc_id, sample=sample)
+    except FileNotFoundError:
+        raise ResultsNotFoundError
 
 
 def add_submissions(course_name, lab, submissions_file):
@@ -165,13 +425,13 @@ def clear_submissions(course_name, lab):
     course_grader.clear_submissions(course_name, lab)
 
 
-def compressed_results(course_name, lab):
+def compressed_results(course_name, lab, sample=False):
     """
     All the possibly returned modules will have a results_to_download function that will be invoked here
     """
-    course_grader = select_course_grader(course_name)
+    course_grader = select_results_grader(course_name, sample)
     # returns a list of file paths
-    results_files = course_grader.results_to_download(course_name, lab)
+    results_files = course_grader.results_to_download(course_name, lab, **get_sample_option(sample))
     # create a zip file of the returned file paths
     zip_file_path = create_zip_file(results_files)
     return zip_file_path
@@ -187,6 +447,16 @@ def get_diff_results_file(course_name, lab):
     return data
 
 
+def get_cache_stats():
+    """
+    Returns the usage statistics of the graders' caches
+    """
+    return {
+        "compile_cache": compile_submission.compile_cache.get_stats(),
+        "test_cases_cache": stdout_common.get_test_cases_cache_stats()
+    }
+
+
 def get_all_courses_data(only_stdout=False):
     all_courses = get_courses_config()
     if only_stdout:
@@ -197,14 +467,27 @@ def get_all_courses_data(only_stdout=False):
     return list(all_courses.values())
 
 
-def get_all_labs_data(course_id):
+def get_all_labs_data(course_id, summary=False):
+    """
+    Returns the labs of the course along with their test cases,
+    if summary is True only the count and sizes of the test cases are included
+    """
     course_labs = get_course_data(course_id)[COURSE_LABS]
     for index, lab in enumerate(course_labs):
-        course_labs[index][LAB_TEST_CASES] = stdout_common.get_test_cases(
-            course_id, lab[LAB_NAME])
+        if summary:
+            course_labs[index][LAB_TEST_CASES_SUMMARY] = stdout_common.get_test_cases_summary(
+                course_id, lab[LAB_NAME])
+        else:
+            course_labs[index][LAB_TEST_CASES] = stdout_common.get_test_cases(
+                course_id, lab[LAB_NAME])
     return course_labs
 
 
+def get_test_cases_page(course_id, lab, offset=0, limit=20, start=0, length=None):
+    get_lab_object(course_id, lab)
+    return stdout_common.get_test_cases_page(course_id, lab, offset, limit, start, length)
+
+
 def get_submission_files(course, lab, submission_id):
     course_grader = select_course_grader(course)
     submission_files_paths = course_grader.get_submission_files(
@@ -241,10 +524,7 @@ def get_submissions_list(course, lab):
 
 
 def get_course_data(course_id):
-    try:
-        course_data = get_courses_config()[course_id]
-    except KeyError:
-        raise CourseNotFoundError()
+    course_data = get_course_object(course_id)
     course_data[COURSE_NAME] = course_id
     return course_data
 
@@ -258,34 +538,31 @@ def get_course_data_with_test_cases(course_id):
 
 
 def update_course_data(course_id, new_course_data):
-    courses_config = get_courses_config_if_course_exists(course_id)
+    get_course_object(course_id)
     stdout_common.create_course_data(course_id, new_course_data[COURSE_LABS])
     for index, _ in enumerate(new_course_data[COURSE_LABS]):
         del new_course_data[COURSE_LABS][index][LAB_TEST_CASES]
     del new_course_data[COURSE_NAME]
-    courses_config[course_id] = new_course_data
-    update_course_config(courses_config)
+    courses_config_store.put_course(course_id, new_course_data)
 
 
 def delete_course(course_id):
-    courses_config = get_courses_config_if_course_exists(course_id)
+    get_course_object(course_id)
     try:
         stdout_common.delete_course(course_id)
     except FileNotFoundError:
         pass
-    del courses_config[course_id]
-    update_course_config(courses_config)
+    courses_config_store.delete_course(course_id)
 
 
 def delete_lab(course_id, lab_id):
-    courses_config = get_courses_config_if_course_exists(course_id)
+    get_course_object(course_id)
     try:
         stdout_common.delete_lab(course_id, lab_id)
     except FileNotFoundError:
         pass
-    courses_config[course_id][COURSE_LABS] = list(
-        filter(lambda lab: lab[LAB_NAME] != lab_id, courses_config[course_id][COURSE_LABS]))
-    update_course_config(courses_config)
+    stdout_common.invalidate_test_cases(course_id, lab_id)
+    courses_config_store.delete_lab(course_id, lab_id)
 
 
 def sanitize_and_validate_lab_data(lab_data):
@@ -301,15 +578,48 @@ def sanitize_and_validate_lab_data(lab_data):
         lab_data[DISABLE_INTERNET] = False if lab_data[DISABLE_INTERNET] == 'false' else True
     if lab_data[LAB_TEST_CASES]:
         lab_data[LAB_TEST_CASES] = json.loads(lab_data[LAB_TEST_CASES])
+    sanitize_optional_number(lab_data, LAB_GRADING_WORKERS, int, 1)
+    sanitize_optional_number(lab_data, LAB_TEST_CASE_WORKERS, int, 1)
+    if LAB_COMPARISON_MODES in lab_data:
+        # Accepts a json list or comma separated modes
+        try:
+            comparison_modes = json.loads(lab_data[LAB_COMPARISON_MODES])
+        except ValueError:
+            comparison_modes = [mode.strip() for mode in lab_data[LAB_COMPARISON_MODES].split(',') if mode.strip()]
+        if not isinstance(comparison_modes, list) or \
+                not set(comparison_modes) <= {mode.value for mode in COMPARISON_MODES}:
+            raise InvalidLabDataError
+        lab_data[LAB_COMPARISON_MODES] = comparison_modes
+    sanitize_optional_number(lab_data, LAB_FLOAT_TOLERANCE, float, 0)
+    sanitize_optional_number(lab_data, LAB_OUTPUT_LIMIT, int, 1)
+    sanitize_optional_number(lab_data, LAB_MEMORY_LIMIT, int, 1)
+    sanitize_optional_number(lab_data, LAB_CPU_TIME_LIMIT, int, 1)
+    sanitize_optional_number(lab_data, LAB_PROCESSES_LIMIT, int, 1)
+    sanitize_optional_number(lab_data, LAB_FILE_SIZE_LIMIT, int, 0)
+
+
+def sanitize_optional_number(lab_data, key, number_type, minimum):
+    """
+    Converts lab_data[key] (if present) to number_type, raises InvalidLabDataError if it's not a number >= minimum
+    """
+    if key not in lab_data:
+        return
+    try:
+        lab_data[key] = number_type(lab_data[key])
+    except:
+        raise InvalidLabDataError
+    if lab_data[key] < minimum:
+        raise InvalidLabDataError
 
 def add_lab(course_id, lab_data, lab_guide = None):
-    courses_config = get_courses_config_if_course_exists(course_id)
+    get_course_object(course_id)
     # Validate lab_data
-    if LAB_NAME in lab_data and lab_data[LAB_NAME] in map(lambda lab: lab[LAB_NAME], courses_config[course_id][COURSE_LABS]):
+    if LAB_NAME in lab_data and courses_config_store.get_lab(course_id, lab_data[LAB_NAME]) is not None:
         raise LabAlreadyExistsError
     sanitize_and_validate_lab_data(lab_data)
     # Start creating lab
     stdout_common.create_lab_dir(course_id, lab_data[LAB_NAME])
+    test_cases = lab_data[LAB_TEST_CASES] or []
     if lab_data[LAB_TEST_CASES]:
         stdout_common.create_test_cases(course_id, lab_data[LAB_NAME], lab_data[LAB_TEST_CASES])
         lab_data[PUBLIC_TEST_CASES] = list(map(lambda tc: tc['id'], filter(lambda tc: tc['public'], lab_data[LAB_TEST_CASES])))
@@ -319,8 +629,8 @@ def add_lab(course_id, lab_data, lab_guide = None):
     else:
         # Using pop to avoid exception if 'lab_guide' is not in lab_data
         lab_data.pop('lab_guide', None)
-    courses_config[course_id][COURSE_LABS].append(lab_data)
-    update_course_config(courses_config)
+    stdout_common.invalidate_test_cases(course_id, lab_data[LAB_NAME])
+    courses_config_store.put_lab(course_id, lab_data, test_cases)
 
 
 def get_lab_guide_content(course, lab):
@@ -333,13 +643,14 @@ def get_lab_guide_content(course, lab):
 
 
 def edit_lab(course_id, lab_data, lab_guide = None):
-    courses_config = get_courses_config_if_course_exists(course_id)
+    get_course_object(course_id)
     # Validate lab_data
-    if LAB_NAME in lab_data and lab_data[LAB_NAME] not in map(lambda lab: lab[LAB_NAME], courses_config[course_id][COURSE_LABS]):
+    if LAB_NAME in lab_data and courses_config_store.get_lab(course_id, lab_data[LAB_NAME]) is None:
         raise LabNotFoundError
     sanitize_and_validate_lab_data(lab_data)
     # Start creating lab
     stdout_common.clear_test_cases(course_id, lab_data[LAB_NAME])
+    test_cases = lab_data[LAB_TEST_CASES] or []
     if lab_data[LAB_TEST_CASES]:
         stdout_common.create_test_cases(
             course_id, lab_data[LAB_NAME], lab_data[LAB_TEST_CASES])
@@ -350,10 +661,8 @@ def edit_lab(course_id, lab_data, lab_guide = None):
         # Using pop to avoid exception if 'lab_guide' is not in lab_data
         lab_data.pop('lab_guide', None)
     del lab_data[LAB_TEST_CASES]
-    courses_config[course_id][COURSE_LABS] = list(filter(
-        lambda lab: lab[LAB_NAME] != lab_data[LAB_NAME], courses_config[course_id][COURSE_LABS]))
-    courses_config[course_id][COURSE_LABS].append(lab_data)
-    update_course_config(courses_config)
+    stdout_common.invalidate_test_cases(course_id, lab_data[LAB_NAME])
+    courses_config_store.put_lab(course_id, lab_data, test_cases)
 
 
 class InvalidConfigError(Exception):
@@ -382,6 +691,22 @@ class NoPublicTestcasesError(Exception):
     pass
 
 
+class GradingJobNotFoundError(Exception):
+    pass
+
+
+class UnsupportedGradingOptionsError(Exception):
+    pass
+
+
+class ResultsNotFoundError(Exception):
+    pass
+
+
+class FailedCaseNotFoundError(Exception):
+    pass
+
+
 class LabAlreadyExistsError(Exception):
     pass
 
@@ -1,17 +1,24 @@
 import sys
 import os
 import shlex
-import subprocess
-import difflib
+import random
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import multiprocessing
 from .lib import compile_submission as compiler
 from .lib import compute_results as compute_results
 from .lib import test_cases_parser as tc_parser
+from .lib import results_cache
+from .lib import results_store
+from .lib import run_submission
 from .lib.submissions_extraction import extract_submissions, clean_directory
+from ..stdout_common.lib import output_comparator
+from ..stdout_common.stdout_common import get_sample_results_path
 import json
 from ...lib.helpers import GRADER_TYPES
 from ...lib.helpers import GRADER_VARIANTS
 from ...lib.helpers import GRADER_LANGUAGES
+from ...app_config import DEFAULT_OUTPUT_LIMIT, RESULT_OUTPUT_MAX_LENGTH
 
 
 
@@ -20,13 +27,24 @@ GRADER_TYPE = GRADER_TYPES.STDOUT.value
 GRADER_VARIANT = GRADER_VARIANTS.C.value
 GRADER_LANGUAGE = GRADER_LANGUAGES.C.value
 
+# The output reported for a test case that failed because the submission exceeded one of its resource limits
+LIMIT_EXCEEDED_OUTPUTS = {
+    "memory": "MEMORY LIMIT EXCEEDED",
+    "cpu_time": "CPU LIMIT EXCEEDED",
+    "file_size": "FILE SIZE LIMIT EXCEEDED"
+}
+
 
 def get_lab_path(course, lab):
     return Path(__file__).joinpath(
         f'../../../courses/{course}/labs/{lab}').resolve()
 
 
-def run_grader(course, lab, runtime_limit = None, public_testcases = None):
+def run_grader(course, lab, runtime_limit = None, public_testcases = None, workers = 1, progress = None,
+               incremental = False, comparison_modes = None, float_tolerance = None,
+               output_limit = DEFAULT_OUTPUT_LIMIT, resource_limits = None,
+               test_case_workers = 1, fail_fast = False, sample_submissions = None, sample_test_cases = None,
+               sample_seed = None):
     """
     Compiles all the submissions in [lab_path/submissions/] directory, runs compiled submissions
     with stdin of the lab's test cases, then builds a dictionary that has all the submissions 
@@ -44,59 +62,225 @@ def run_grader(course, lab, runtime_limit = None, public_testcases = None):
             "passed": [1, 2, 3, 5, 6, 7],
             "failed": [
                 {"tc_id": "4", "diff": *DIFF TEXT*}, 
+            "resources": [
+                {"tc_id": "1", "wall_time": 0.0021, "user_time": 0.001, "system_time": 0.0005, "max_rss": 1480},
+                ...]
         }
     }
+    If workers is greater than 1 the submissions are graded in a pool of that many processes,
+    each process grades a whole submission and hands its record back to be aggregated here
+    test_case_workers is the number of test cases of a single submission that may run at the same time
+    progress, if given, is called with (graded submissions count, total submissions count) after every submission
+    The result of every (submission, test case) pair is stored in the lab's results cache, if incremental is True
+    only the pairs whose executable or test case changed since the last run are executed again
+    The outputs are compared as bytes, comparison_modes (see output_comparator.COMPARISON_MODES) allow
+    differences in trailing whitespace, line endings or floating point numbers up to float_tolerance
+    A submission is killed as soon as it writes more than output_limit bytes to stdout and only a prefix
+    of its output is kept in the failed test cases
+    resource_limits (memory, cpu_time, processes, file_size) are enforced on every execution of a submission
+    For quick feedback fail_fast stops grading a submission at its first failing test case, and
+    sample_submissions/sample_test_cases grade only a random subset (seeded by sample_seed) of that many
+    submissions/test cases, the results of a sampled run are written to a separate result set
+    (see get_sample_results_path) so the lab's results of its last full run are kept
     """
     LAB_ABS_PATH = get_lab_path(course, lab)
     test_cases = tc_parser.get_test_cases(LAB_ABS_PATH, public_testcases)
-    submission_result_list = []
-
-    # Looping over all the submissions in [lab_path/submissions/] directory, first compile the submission
-    # then loop over all test_cases for this lab, run the compiled submissions with stdin of the test case input
-    # then compare it to the test case output, if both matched add the test case id to the "passed" array
-    # if not add the test case id along with the diff between outout and test case expected output to "failed" array
-    for _, dir, _ in os.walk(LAB_ABS_PATH.joinpath(f"submissions")):
-        for i in dir:
-            submission_dir = str(
-                LAB_ABS_PATH.joinpath(f"submissions")) + f"/{i}"
-            compiler.compile_submission(Path(submission_dir))
-
-            current_submission = {
-                "id": i,
-                "passed": [],
-                "failed": []
-            }
-            for tc in test_cases:
-                exec_command = f"./a.out"
-                cmd = shlex.split(exec_command)
-                exceeded_runtime_limit = False
-                try:
-                    cprocess = subprocess.run(
-                        cmd, input=tc[1], cwd=submission_dir, capture_output=True, text=True, timeout=runtime_limit)
-                except subprocess.TimeoutExpired:
-                    exceeded_runtime_limit = True
-                differences = ""
-                for line in difflib.context_diff(cprocess.stdout, tc[2]):
-                    differences += line + "\n"
-                if(len(differences) == 0):
-                   current_submission["passed"].append(tc[0])
-                else:
-                    student_output = ""
-                    if exceeded_runtime_limit:
-                        student_output = "RUNTIME LIMIT EXCEEDED"
-                    elif cprocess.returncode != 0:
-                        student_output = "ERROR"
-                    else:
-                        student_output = cprocess.stdout
-                    current_submission["failed"].append({
-                        "tc_id": tc[0],
-                        "output": student_output,
-                        "expected": tc[2]
-                    })
-            submission_result_list.append(current_submission)
-                
+    submissions_path = LAB_ABS_PATH.joinpath("submissions")
+    submission_dirs = [submissions_path.joinpath(i) for i in get_submissions_ids(submissions_path)]
+    all_submissions_ids = {submission_dir.name for submission_dir in submission_dirs}
+    random_generator = random.Random(sample_seed)
+    if sample_test_cases:
+        test_cases = get_random_sample(random_generator, test_cases, sample_test_cases)
+    if sample_submissions:
+        submission_dirs = get_random_sample(random_generator, submission_dirs, sample_submissions)
+    # Everything other than the executable and the test case that affects a test case result
+    settings = {
+        "runtime_limit": runtime_limit,
+        "comparison_modes": sorted(comparison_modes or []),
+        "float_tolerance": float_tolerance,
+        "output_limit": output_limit,
+        "resource_limits": resource_limits or {}
+    }
+    stored_results = results_cache.load_results_cache(LAB_ABS_PATH, settings)
+    previous_results = stored_results if incremental else {}
+
+    if progress:
+        progress(0, len(submission_dirs))
+    if workers and workers > 1 and len(submission_dirs) > 1:
+        graded_submissions = [None] * len(submission_dirs)
+        # Grading runs inside the manager's background threads, spawn is used instead of fork
+        # so that the workers don't inherit locks held by the other threads
+        # The workers map the test cases pack themselves, only the test cases ids are sent to them
+        test_cases_ids = [tc[0] for tc in test_cases]
+        with ProcessPoolExecutor(
+                max_workers=min(workers, len(submission_dirs)),
+                mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = {
+                executor.submit(
+                    grade_packed_submission, submission_dir, LAB_ABS_PATH, test_cases_ids, settings,
+                    previous_results.get(submission_dir.name), test_case_workers, fail_fast): index
+                for index, submission_dir in enumerate(submission_dirs)}
+            for done, future in enumerate(as_completed(futures), start=1):
+                graded_submissions[futures[future]] = future.result()
+                if progress:
+                    progress(done, len(submission_dirs))
+    else:
+        graded_submissions = []
+        for submission_dir in submission_dirs:
+            graded_submissions.append(grade_submission(
+                submission_dir, test_cases, settings, previous_results.get(submission_dir.name),
+                test_case_workers, fail_fast))
+            if progress:
+                progress(len(graded_submissions), len(submission_dirs))
+
+    submission_result_list = [record for record, _ in graded_submissions]
+    # The stored results of the existing submissions that weren't sampled in this run are kept
+    # and so are the stored results of the test cases that weren't run
+    new_results = {
+        submission_id: entry for submission_id, entry in stored_results.items() if submission_id in all_submissions_ids}
+    for record, entry in graded_submissions:
+        new_results[record["id"]] = results_cache.merge_entry(new_results.get(record["id"]), entry)
+    results_cache.save_results_cache(LAB_ABS_PATH, settings, new_results)
     # compute_total_result will take the results dict then create results files in the lab's directory
-    compute_results.compute_total_result(submission_result_list, LAB_ABS_PATH, len(test_cases))
+    results_path = get_sample_results_path(LAB_ABS_PATH) if sample_submissions or sample_test_cases else LAB_ABS_PATH
+    compute_results.compute_total_result(submission_result_list, results_path, len(test_cases))
+
+
+def get_submissions_ids(submissions_path):
+    """
+    Returns the names of the submissions directories inside [lab_path/submissions/]
+    """
+    _, submissions_ids, _ = next(os.walk(submissions_path), (None, [], None))
+    return submissions_ids
+
+
+def get_random_sample(random_generator, items, sample_size):
+    """
+    Returns sample_size random items (or all of them if there are fewer) keeping their original order
+    """
+    if sample_size >= len(items):
+        return items
+    sample_indexes = sorted(random_generator.sample(range(len(items)), sample_size))
+    return [items[index] for index in sample_indexes]
+
+
+def grade_packed_submission(submission_dir, lab_path, test_cases_ids, settings, previous_results = None,
+                            test_case_workers = 1, fail_fast = False):
+    """
+    grade_submission for the grading processes, the test cases are read from the lab's test cases pack
+    which was already refreshed by run_grader
+    """
+    test_cases = tc_parser.get_test_cases(lab_path, test_cases_ids, refresh=False)
+    return grade_submission(
+        submission_dir, test_cases, settings, previous_results, test_case_workers, fail_fast)
+
+
+def grade_submission(submission_dir, test_cases, settings, previous_results = None, test_case_workers = 1,
+                     fail_fast = False):
+    """
+    Compiles a single submission, runs the compiled submission with stdin of every test case input
+    then compares its output to the test case output, if both matched the test case id is added to the "passed" array
+    if not the test case id along with the submission's output and the expected output are added to "failed" array
+    previous_results is the submission's entry in the results cache, test cases whose results were stored
+    for the same executable and the same test case content are not executed again
+    The wall time, cpu time and peak memory of every test case execution are added to the "resources" array
+    If test_case_workers is greater than 1 up to that many test cases are executed at the same time,
+    the arrays are still filled in the test cases order
+    If fail_fast is True the test cases after the first failing one aren't executed, they are added to
+    the "failed" array as NOT RUN unless their result is already known (cached or already executed)
+    Returns the submission record that compute_results expects along with the submission's new results cache entry
+    """
+    compiler.compile_submission(Path(submission_dir))
+    binary_hash = results_cache.hash_file(Path(submission_dir).joinpath("a.out"))
+    cached_results = results_cache.get_cached_results(previous_results, binary_hash)
+    pending_test_cases_ids = {
+        tc[0] for tc in test_cases if tc[0] not in cached_results or cached_results[tc[0]]["hash"] != tc[3]}
+
+    current_submission = {
+        "id": Path(submission_dir).name,
+        "passed": [],
+        "failed": [],
+        "resources": []
+    }
+    executor = None
+    futures = {}
+    if test_case_workers and test_case_workers > 1 and len(pending_test_cases_ids) > 1:
+        # The test cases are independent, threads are enough since they only wait for the submission's processes
+        executor = ThreadPoolExecutor(max_workers=min(test_case_workers, len(pending_test_cases_ids)))
+        futures = {tc[0]: executor.submit(run_test_case, submission_dir, tc, settings)
+                   for tc in test_cases if tc[0] in pending_test_cases_ids}
+    stopped = False
+    try:
+        for tc in test_cases:
+            if tc[0] in futures and (not stopped or futures[tc[0]].done()) and not futures[tc[0]].cancelled():
+                cached_results[tc[0]] = futures[tc[0]].result()
+            elif tc[0] in pending_test_cases_ids:
+                if stopped:
+                    current_submission["failed"].append(
+                        {"tc_id": tc[0], "output": "NOT RUN", "expected": bytes(tc[2]).decode(errors="replace")})
+                    continue
+                cached_results[tc[0]] = run_test_case(submission_dir, tc, settings)
+            tc_result = cached_results[tc[0]]
+            current_submission["resources"].append({"tc_id": tc[0], **tc_result["resources"]})
+            if tc_result["passed"]:
+                current_submission["passed"].append(tc[0])
+                continue
+            current_submission["failed"].append(tc_result["failed"])
+            if fail_fast and not stopped:
+                stopped = True
+                for future in futures.values():
+                    future.cancel()
+    finally:
+        if executor:
+            for future in futures.values():
+                future.cancel()
+            executor.shutdown()
+    return current_submission, results_cache.create_entry(binary_hash, cached_results)
+
+
+def run_test_case(submission_dir, tc, settings):
+    """
+    Runs the compiled submission with stdin of the test case input and compares its output to the expected output
+    Returns the test case result as stored in the results cache
+    """
+    exec_command = f"./a.out"
+    cmd = shlex.split(exec_command)
+    # The submission reads the test case's input file directly, it's only written through a pipe
+    # from the test cases pack if the file changed since the pack was built
+    with tc_parser.open_input(tc) as input_file:
+        execution = run_submission.run_executable(
+            cmd, submission_dir, input_file or tc[1], timeout=settings["runtime_limit"],
+            output_limit=settings["output_limit"], resource_limits=settings["resource_limits"])
+    if not execution["timed_out"] and not execution["output_limit_exceeded"] and \
+            output_comparator.outputs_match(
+                execution["stdout"], tc[2], settings["comparison_modes"], settings["float_tolerance"]):
+        return {"hash": tc[3], "passed": True, "resources": execution["resources"]}
+    student_output = ""
+    if execution["timed_out"]:
+        student_output = "RUNTIME LIMIT EXCEEDED"
+    elif execution["output_limit_exceeded"]:
+        student_output = "OUTPUT LIMIT EXCEEDED"
+    elif execution["limit_exceeded"]:
+        student_output = LIMIT_EXCEEDED_OUTPUTS[execution["limit_exceeded"]]
+    elif execution["returncode"] != 0:
+        student_output = "ERROR"
+    else:
+        student_output = output_comparator.normalize_newlines(
+            execution["stdout"][:RESULT_OUTPUT_MAX_LENGTH]).decode(errors="replace")
+    failed = {
+        "tc_id": tc[0],
+        "output": student_output,
+        "expected": bytes(tc[2]).decode(errors="replace")
+    }
+    if len(execution["stdout"]) > RESULT_OUTPUT_MAX_LENGTH:
+        # Only a prefix of long outputs is kept in the results
+        failed["output_truncated"] = True
+    return {
+        "hash": tc[3],
+        "passed": False,
+        "failed": failed,
+        "resources": execution["resources"]
+    }
 
 
 def add_submissions(course, lab, submissions_file):
@@ -122,22 +306,49 @@ def clear_submissions(course, lab):
     clean_directory(lab_path.joinpath('submissions'))
 
 
-def results_to_download(course, lab):
+def get_results_path(course, lab, sample=False):
+    """
+    Returns the directory of the lab's results, the results of its last sampled run if sample is True
+    """
+    lab_path = get_lab_path(course, lab)
+    return get_sample_results_path(lab_path) if sample else lab_path
+
+
+def results_to_download(course, lab, sample=False):
     """
     Returns a list of files Paths, these files could be result files, crash logs or whatever files
     that have information about the grading process. 
     """
-    lab_path = get_lab_path(course, lab)
-    return list(lab_path.glob("**/*_results.txt")) + list(lab_path.glob("**/*_result_summary.txt"))
+    results_path = get_results_path(course, lab, sample)
+    return list(results_path.glob("**/*_results.txt")) + list(results_path.glob("**/*_result_summary.txt"))
 
 
-def get_diff_results_file(course_name, lab):
-    path = Path("graderx").joinpath("graders").joinpath(
-        "courses").joinpath(course_name).joinpath("labs").joinpath(lab)
-    file_path = path.joinpath(f"{lab}_diff_result.json")
-    with open(file_path) as f:
-        data = json.load(f)
-    return data
+def get_grades(course, lab, sample=False):
+    """
+    Returns an iterator of the grades of the lab's submissions read from the lab's results store
+    """
+    return results_store.iter_grades(get_results_path(course, lab, sample))
+
+
+def get_diff_page(course, lab, offset=0, limit=20, submission_id=None, tc_id=None, metadata_only=False,
+                  sample=False):
+    return results_store.get_diff_page(
+        get_results_path(course, lab, sample), offset, limit, submission_id, tc_id, metadata_only)
+
+
+def get_failed_case(course, lab, submission_id, tc_id, sample=False):
+    return results_store.get_failed_case(get_results_path(course, lab, sample), submission_id, tc_id)
+
+
+def get_failure_clusters(course, lab, tc_id=None, sample=False):
+    return results_store.get_failure_clusters(get_results_path(course, lab, sample), tc_id)
+
+
+def get_diff_results_file(course_name, lab, sample=False):
+    """
+    Returns the lab's diff results with the outputs of the failed test cases in place of their hashes
+    """
+    return compute_results.read_diff_json(get_results_path(course_name, lab, sample))
 
 def get_submission_files(course, lab, submission_id):
     lab_path = get_lab_path(course, lab)
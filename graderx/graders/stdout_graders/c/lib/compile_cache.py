@@ -0,0 +1,150 @@
+import fcntl
+import functools
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+from contextlib import contextmanager
+from pathlib import Path
+from ....lib.atomic_files import atomic_replace, atomic_write
+
+
+SOURCE_FILES_PATTERNS = ("*.c", "*.h")
+
+
+@functools.lru_cache(maxsize=None)
+def get_compiler_version(compiler):
+    """
+    Returns the version banner of the given compiler so that upgrading it invalidates the cached binaries
+    """
+    try:
+        return subprocess.run([compiler, "--version"], capture_output=True).stdout
+    except OSError:
+        return b""
+
+
+class CompileCache:
+    """
+    Stores compiled binaries in cache_path named after the hash of everything that affects the compilation
+    (source files, commands.yml, compile command and compiler version)
+    The total size of the stored binaries is kept under max_size by evicting the least recently used ones,
+    a max_size of 0 disables the cache
+    Hits and misses are counted in a stats file so that they're shared by all the grading processes
+    """
+
+    def __init__(self, cache_path, max_size):
+        self.cache_path = Path(cache_path)
+        self.max_size = max_size
+
+    def is_enabled(self):
+        return self.max_size > 0
+
+    def get_key(self, submission_directory, cmd):
+        key = hashlib.sha256()
+        key.update(get_compiler_version(cmd[0]))
+        key.update(json.dumps(cmd).encode())
+        key.update(submission_directory.joinpath("commands.yml").read_bytes())
+        source_files = set()
+        for pattern in SOURCE_FILES_PATTERNS:
+            source_files.update(submission_directory.rglob(pattern))
+        for source_file in sorted(source_files):
+            key.update(str(source_file.relative_to(submission_directory)).encode())
+            key.update(b"\0")
+            key.update(source_file.read_bytes())
+            key.update(b"\0")
+        return key.hexdigest()
+
+    def get(self, key, destination):
+        """
+        Copies the cached binary of the given key to destination, returns False if there's no such binary
+        """
+        if not self.is_enabled():
+            return False
+        entry = self.cache_path.joinpath(key)
+        try:
+            shutil.copy(entry, destination)
+            # The modification time of an entry is its last use time, used for the LRU eviction
+            os.utime(entry)
+        except FileNotFoundError:
+            self.count("misses")
+            return False
+        self.count("hits")
+        return True
+
+    def put(self, key, binary_path):
+        if not self.is_enabled():
+            return
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        # Other processes never see a partial binary, the temporary file's name starts with "." like the
+        # cache's own files so it isn't taken for an entry
+        with atomic_replace(self.cache_path.joinpath(key)) as tmp_path:
+            shutil.copy(binary_path, tmp_path)
+        self.evict()
+
+    def get_entries(self):
+        if not self.cache_path.exists():
+            return []
+        entries = []
+        for entry in self.cache_path.iterdir():
+            if entry.name.startswith("."):
+                continue
+            try:
+                entries.append((entry, entry.stat()))
+            except FileNotFoundError:
+                pass
+        return entries
+
+    def evict(self):
+        """
+        Removes the least recently used binaries until the cache size is at most max_size
+        """
+        with self.lock():
+            entries = sorted(self.get_entries(), key=lambda entry: entry[1].st_mtime)
+            cache_size = sum(stat.st_size for _, stat in entries)
+            for entry, stat in entries:
+                if cache_size <= self.max_size:
+                    break
+                try:
+                    entry.unlink()
+                except FileNotFoundError:
+                    pass
+                cache_size -= stat.st_size
+
+    @contextmanager
+    def lock(self):
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        with open(self.cache_path.joinpath(".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read_counters(self):
+        try:
+            with open(self.cache_path.joinpath(".stats.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {"hits": 0, "misses": 0}
+
+    def count(self, counter):
+        with self.lock():
+            counters = self.read_counters()
+            counters[counter] += 1
+            with atomic_write(self.cache_path.joinpath(".stats.json")) as f:
+                json.dump(counters, f)
+
+    def get_stats(self):
+        counters = self.read_counters()
+        entries = self.get_entries()
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            "enabled": self.is_enabled(),
+            "hits": counters["hits"],
+            "misses": counters["misses"],
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else None,
+            "entries": len(entries),
+            "size": sum(stat.st_size for _, stat in entries),
+            "max_size": self.max_size
+        }
@@ -3,6 +3,11 @@ import shlex
 import subprocess
 import yaml
 from pathlib import Path
+from .compile_cache import CompileCache
+from ....app_config import COMPILE_CACHE_PATH, COMPILE_CACHE_MAX_SIZE
+
+
+compile_cache = CompileCache(COMPILE_CACHE_PATH, COMPILE_CACHE_MAX_SIZE)
 
 
 def remove_output(cmd):
@@ -20,6 +25,7 @@ def compile_submission(submission_directory: Path):
     """
     Takes a single submission directory and compiles the code inside using the compile
     command provided inside that directory, the executable
+    If the same sources were compiled before with the same command the cached executable is reused instead
     may raise: CompilationFailedError
     """
     with open(submission_directory.joinpath("commands.yml"), "r") as f:
@@ -29,10 +35,16 @@ def compile_submission(submission_directory: Path):
         remove_output(cmd)
         # Add -w in the end of the command to suppress all gcc warnings
         cmd.append("-w")
-        cprocess = subprocess.run(
-            cmd, cwd=submission_directory, capture_output=True, text=True)
-        if cprocess.returncode != 0:
-            raise CompilationFailedError(cprocess.stderr)
+    executable_path = submission_directory.joinpath("a.out")
+    cache_key = compile_cache.get_key(submission_directory, cmd)
+    if compile_cache.get(cache_key, executable_path):
+        return
+    cprocess = subprocess.run(
+        cmd, cwd=submission_directory, capture_output=True, text=True)
+    if cprocess.returncode != 0:
+        raise CompilationFailedError(cprocess.stderr)
+    if executable_path.exists():
+        compile_cache.put(cache_key, executable_path)
 
 
 class CompilationFailedError(Exception):
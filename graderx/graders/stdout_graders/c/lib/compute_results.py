@@ -2,6 +2,9 @@ from pathlib import Path
 import os
 import sys
 import json
+import hashlib
+from ...stdout_common.lib.output_comparator import build_line_diff
+from . import results_store
 
 
 pass_threshold = 50
@@ -19,10 +22,13 @@ def compute_total_result(submissions_list, lab_abs_path, test_cases_count):
         content = format_content(grade, failed_report)
         path = get_path(lab_abs_path, item['id'])
         write_internal_report(content, path)
+    outputs, diff = deduplicate_outputs(submissions_list)
     # TODO: make write diff/chart consistant
-    write_diff_json(submissions_list, lab_abs_path, test_cases_count)
+    write_diff_json(diff, outputs, lab_abs_path, test_cases_count)
     write_chart_json(submissions_list, lab_abs_path, grades_summary)
     write_summary_report(grades_summary, lab_abs_path)
+    results_store.write_results_store(
+        lab_abs_path, submissions_list, diff, outputs, grades_summary, test_cases_count)
 
 
 def handle_grades(id):
@@ -33,11 +39,12 @@ def handle_grades(id):
 def get_failed_cases(fail_data):
     """
     takes submissions_list[i]['failed']
+    the line diff between the output and the expected output is only built here for the report
     """
     data = ''
     for i in fail_data:
         data += '-'*10
-        data += f"\ntest case id: {i['tc_id']}\ndifference: {i['expected']}\n"
+        data += f"\ntest case id: {i['tc_id']}\ndifference:\n{build_line_diff(i['output'], i['expected'])}\n"
     return data
 
 
@@ -98,11 +105,81 @@ def format_content(grade, failed_reports):
     return f'* Total Grade: {grade}\n* Failed Test Cases:\n{failed_reports}'
 
 
-def write_diff_json(submissions_list, path, test_cases_count):
+def hash_output(output):
+    return hashlib.sha256(output.encode()).hexdigest()
+
+
+def deduplicate_outputs(submissions_list):
+    """
+    Replaces the output and the expected output of every failed test case with the hashes of their content
+    Returns the content of every distinct output by its hash along with the diff records:
+    ({"9b74c9...": "3\n", ...},
+     [{"id": "2136_2315", "failed": [{"tc_id": "4", "output_hash": "...", "expected_hash": "..."}], "resources": []}])
+    """
+    outputs = {}
+    hashes = {}
+
+    def get_hash(output):
+        output_hash = hashes.get(output)
+        if output_hash is None:
+            output_hash = hash_output(output)
+            hashes[output] = output_hash
+            outputs[output_hash] = output
+        return output_hash
+
+    diff = []
+    for item in submissions_list:
+        failed = []
+        for failed_case in item["failed"]:
+            record = {
+                "tc_id": failed_case["tc_id"],
+                "output_hash": get_hash(failed_case["output"]),
+                "expected_hash": get_hash(failed_case["expected"])
+            }
+            if failed_case.get("output_truncated"):
+                record["output_truncated"] = True
+            failed.append(record)
+        diff.append({"id": item["id"], "failed": failed, "resources": item.get("resources", [])})
+    return outputs, diff
+
+
+def expand_failed_case(record, outputs):
+    """
+    Replaces the hashes of a failed test case record with the outputs they refer to
+    """
+    failed_case = {
+        "tc_id": record["tc_id"],
+        "output": outputs[record["output_hash"]],
+        "expected": outputs[record["expected_hash"]]
+    }
+    if record.get("output_truncated"):
+        failed_case["output_truncated"] = True
+    return failed_case
+
+
+def read_diff_json(path):
+    """
+    Reads the lab's diff json file and returns it with the outputs in place of their hashes,
+    files written before the outputs were deduplicated have no "outputs" and are returned as they are
+    """
+    with open(path.joinpath(f'{get_lab_name(path)}_diff_result.json')) as f:
+        diff_json = json.load(f)
+    if "outputs" not in diff_json:
+        return diff_json
+    outputs = diff_json.pop("outputs")
+    for item in diff_json["diff"]:
+        item["failed"] = [expand_failed_case(record, outputs) for record in item["failed"]]
+    return diff_json
+
+
+def write_diff_json(diff, outputs, path, test_cases_count):
+    """
+    Every distinct output is stored once in "outputs" and the failed test cases refer to it by its hash
+    """
     diff_list = {
         "total_test_cases_count": test_cases_count,
-        "diff": [{"id": item["id"], "failed":item["failed"]}
-                 for item in submissions_list]
+        "outputs": outputs,
+        "diff": diff
     }
     diff_json = json.dumps(diff_list)
 
@@ -137,7 +214,34 @@ def get_charts_json(submissions_list, grades_summary):
                      for k, v in grades_summary.items()]
     chart = {
         'passed_tc': passed_list,
-        'students_list': students_list
+        'students_list': students_list,
+        'tc_resources': get_resources_summary(submissions_list)
     }
 
     return json.dumps(chart)
+
+
+def get_resources_summary(submissions_list):
+    """
+    Summarises the resources used by all the submissions for every test case
+    cpu time is the user time plus the system time, times are in seconds and max_rss in KiB,
+    max_rss is the peak of the runs whose max_rss is known (None if none of them is)
+    """
+    tc_resources = {}
+    for item in submissions_list:
+        for resources in item.get('resources', []):
+            tc_resources.setdefault(resources['tc_id'], []).append(resources)
+    summary = []
+    for tc_id, runs in tc_resources.items():
+        wall_times = [run['wall_time'] for run in runs]
+        cpu_times = [run['user_time'] + run['system_time'] for run in runs]
+        summary.append({
+            "tc_id": tc_id,
+            "runs": len(runs),
+            "avg_wall_time": round(sum(wall_times)/len(runs), 6),
+            "max_wall_time": max(wall_times),
+            "avg_cpu_time": round(sum(cpu_times)/len(runs), 6),
+            "max_cpu_time": round(max(cpu_times), 6),
+            "max_rss": results_store.get_max_rss(runs)
+        })
+    return summary
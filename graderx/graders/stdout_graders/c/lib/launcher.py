@@ -0,0 +1,46 @@
+import functools
+import hashlib
+import subprocess
+import threading
+from pathlib import Path
+from ....app_config import LAUNCHER_BUILD_PATH
+from ....lib.atomic_files import atomic_replace
+
+
+LAUNCHER_SOURCES_PATH = Path(__file__).parent.joinpath("launcher")
+_build_lock = threading.Lock()
+
+
+def build(source_name, compile_options=()):
+    """
+    Compiles the C source launcher/source_name once and returns the path of the result,
+    it's named after the hash of the source and the options so that a changed source is compiled again
+    The result is written to a temporary file that replaces it so concurrent grading processes
+    never run a partial binary
+    """
+    source_path = LAUNCHER_SOURCES_PATH.joinpath(source_name)
+    source = source_path.read_bytes()
+    key = hashlib.sha256(source + "\0".join(compile_options).encode()).hexdigest()[:16]
+    output_path = LAUNCHER_BUILD_PATH.joinpath(f"{source_path.stem}_{key}")
+    if output_path.exists():
+        return output_path
+    with _build_lock:
+        if output_path.exists():
+            return output_path
+        LAUNCHER_BUILD_PATH.mkdir(parents=True, exist_ok=True)
+        with atomic_replace(output_path) as tmp_path:
+            subprocess.run(
+                ["gcc", "-O2", *compile_options, "-o", str(tmp_path), str(source_path)],
+                check=True, capture_output=True)
+    return output_path
+
+
+# The paths are only resolved once per process, every execution of a submission needs them
+@functools.lru_cache(maxsize=None)
+def get_launcher_path():
+    return build("launcher.c")
+
+
+@functools.lru_cache(maxsize=None)
+def get_alloc_guard_path():
+    return build("alloc_guard.c", ("-shared", "-fPIC"))
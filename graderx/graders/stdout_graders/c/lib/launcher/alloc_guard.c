@@ -0,0 +1,61 @@
+/*
+ * Preloaded in submissions that run under a memory limit (see launcher.c), it writes a byte to the fd in
+ * GRADERX_ALLOC_FAILED_FD whenever malloc, calloc or realloc fails so that the grader can tell that the
+ * submission ran out of memory: an address space limit makes allocations fail without the resident size
+ * ever getting close to the limit. Allocations made with mmap or the memalign functions aren't watched.
+ * Only the first failure is reported and the pipe doesn't block (see launcher.c), the launcher only reads it
+ * once the submission exits so a submission that keeps failing to allocate must not wait on a full pipe.
+ */
+#define _GNU_SOURCE
+#include <errno.h>
+#include <signal.h>
+#include <stdlib.h>
+#include <unistd.h>
+
+extern void *__libc_malloc(size_t size);
+extern void *__libc_calloc(size_t count, size_t size);
+extern void *__libc_realloc(void *pointer, size_t size);
+
+static int alloc_failed_fd = -1;
+static volatile sig_atomic_t failure_reported = 0;
+
+__attribute__((constructor)) static void read_alloc_failed_fd(void) {
+    const char *fd = getenv("GRADERX_ALLOC_FAILED_FD");
+    if (fd != NULL) {
+        alloc_failed_fd = atoi(fd);
+    }
+}
+
+static void report_failure(void) {
+    if (alloc_failed_fd >= 0 && !failure_reported) {
+        int saved_errno = errno;
+        failure_reported = 1;
+        ssize_t written = write(alloc_failed_fd, "1", 1);
+        (void) written;
+        errno = saved_errno;
+    }
+}
+
+void *malloc(size_t size) {
+    void *pointer = __libc_malloc(size);
+    if (pointer == NULL && size != 0) {
+        report_failure();
+    }
+    return pointer;
+}
+
+void *calloc(size_t count, size_t size) {
+    void *pointer = __libc_calloc(count, size);
+    if (pointer == NULL && count != 0 && size != 0) {
+        report_failure();
+    }
+    return pointer;
+}
+
+void *realloc(void *pointer, size_t size) {
+    void *new_pointer = __libc_realloc(pointer, size);
+    if (new_pointer == NULL && size != 0) {
+        report_failure();
+    }
+    return new_pointer;
+}
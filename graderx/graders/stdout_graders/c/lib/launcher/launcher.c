@@ -0,0 +1,129 @@
+/*
+ * Starts a submission for run_submission.run_executable:
+ *     launcher REPORT_FD [-g ALLOC_GUARD] [-l RESOURCE:SOFT:HARD ...] -- CMD [ARG ...]
+ * The launcher is a small process so the submission, forked from it, starts with a small resident size,
+ * the peak resident size reported by wait4 for a process forked from the grader can't be lower than the
+ * grader's own. The -l rlimits are set in the forked process right before it executes CMD so that no
+ * python code runs between fork and exec in the (multithreaded) grader.
+ * -g preloads the alloc_guard.c library which reports the allocations that failed through a non blocking pipe.
+ * Once the submission exits "MAX_RSS_KIB ALLOCATION_FAILED\n" is written to REPORT_FD and the launcher
+ * exits with the submission's exit code or is killed by the signal that killed the submission.
+ */
+#define _GNU_SOURCE
+#include <errno.h>
+#include <fcntl.h>
+#include <signal.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/resource.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+#include <unistd.h>
+
+#define LAUNCHER_ERROR 127
+#define MAX_LIMITS 16
+
+struct limit {
+    int resource;
+    struct rlimit value;
+};
+
+static int usage(const char *name) {
+    fprintf(stderr, "usage: %s REPORT_FD [-g ALLOC_GUARD] [-l RESOURCE:SOFT:HARD ...] -- CMD [ARG ...]\n", name);
+    return LAUNCHER_ERROR;
+}
+
+int main(int argc, char **argv) {
+    if (argc < 4) {
+        return usage(argv[0]);
+    }
+    int report_fd = atoi(argv[1]);
+    const char *alloc_guard = NULL;
+    struct limit limits[MAX_LIMITS];
+    int limits_count = 0;
+    int i = 2;
+    for (; i < argc && strcmp(argv[i], "--") != 0; i += 2) {
+        if (i + 1 >= argc) {
+            return usage(argv[0]);
+        }
+        if (strcmp(argv[i], "-g") == 0) {
+            alloc_guard = argv[i + 1];
+        } else if (strcmp(argv[i], "-l") == 0 && limits_count < MAX_LIMITS) {
+            unsigned long long soft, hard;
+            struct limit *limit = &limits[limits_count++];
+            if (sscanf(argv[i + 1], "%d:%llu:%llu", &limit->resource, &soft, &hard) != 3) {
+                return usage(argv[0]);
+            }
+            limit->value.rlim_cur = soft;
+            limit->value.rlim_max = hard;
+        } else {
+            return usage(argv[0]);
+        }
+    }
+    if (i + 1 >= argc) {
+        return usage(argv[0]);
+    }
+    char **cmd = argv + i + 1;
+    fcntl(report_fd, F_SETFD, FD_CLOEXEC);
+
+    int alloc_pipe[2] = {-1, -1};
+    if (alloc_guard != NULL) {
+        if (pipe(alloc_pipe) != 0) {
+            return LAUNCHER_ERROR;
+        }
+        fcntl(alloc_pipe[0], F_SETFD, FD_CLOEXEC);
+        fcntl(alloc_pipe[0], F_SETFL, O_NONBLOCK);
+        /* The submission's reports are dropped rather than blocking it if the pipe is ever full */
+        fcntl(alloc_pipe[1], F_SETFL, O_NONBLOCK);
+    }
+
+    pid_t pid = fork();
+    if (pid < 0) {
+        return LAUNCHER_ERROR;
+    }
+    if (pid == 0) {
+        if (alloc_guard != NULL) {
+            char fd[16];
+            snprintf(fd, sizeof(fd), "%d", alloc_pipe[1]);
+            setenv("GRADERX_ALLOC_FAILED_FD", fd, 1);
+            setenv("LD_PRELOAD", alloc_guard, 1);
+        }
+        for (int j = 0; j < limits_count; j++) {
+            if (setrlimit(limits[j].resource, &limits[j].value) != 0) {
+                _exit(LAUNCHER_ERROR);
+            }
+        }
+        execvp(cmd[0], cmd);
+        _exit(LAUNCHER_ERROR);
+    }
+    if (alloc_guard != NULL) {
+        close(alloc_pipe[1]);
+    }
+
+    int status;
+    struct rusage usage;
+    while (wait4(pid, &status, 0, &usage) < 0) {
+        if (errno != EINTR) {
+            return LAUNCHER_ERROR;
+        }
+    }
+    char byte;
+    int allocation_failed = alloc_guard != NULL && read(alloc_pipe[0], &byte, 1) == 1;
+    dprintf(report_fd, "%ld %d\n", usage.ru_maxrss, allocation_failed);
+    close(report_fd);
+
+    if (WIFSIGNALED(status)) {
+        int signal_number = WTERMSIG(status);
+        struct rlimit no_core = {0, 0};
+        sigset_t signals;
+        setrlimit(RLIMIT_CORE, &no_core);
+        signal(signal_number, SIG_DFL);
+        sigemptyset(&signals);
+        sigaddset(&signals, signal_number);
+        sigprocmask(SIG_UNBLOCK, &signals, NULL);
+        raise(signal_number);
+        return 128 + signal_number;
+    }
+    return WEXITSTATUS(status);
+}
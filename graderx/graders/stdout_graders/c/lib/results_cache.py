@@ -0,0 +1,87 @@
+import hashlib
+import json
+from .compute_results import get_lab_name
+from ....lib.atomic_files import atomic_write
+
+
+# Stored results of a different version are dropped, bump it whenever the stored results format changes
+RESULTS_CACHE_VERSION = 2
+
+
+def get_results_cache_path(lab_abs_path):
+    return lab_abs_path.joinpath(f'{get_lab_name(lab_abs_path)}_results_cache.json')
+
+
+def hash_file(path):
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def hash_settings(settings):
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+
+def load_results_cache(lab_abs_path, settings):
+    """
+    Returns the stored results of the lab's last run as a dict with the submissions ids as keys
+    example:
+    {
+        "3245_3213": {
+            "binary_hash": "9b74c9...",
+            "test_cases": {
+                "1": {"hash": "5e8848...", "passed": True, "resources": {"wall_time": 0.0021, ...}},
+                "2": {"hash": "2cf24d...", "passed": False, "failed": {"tc_id": "2", "output": ..., "expected": ...},
+                      "resources": {"wall_time": 1.0012, ...}}
+            }
+        }
+    }
+    The stored results are dropped if they were computed with different settings (runtime limit, ...)
+    """
+    try:
+        with open(get_results_cache_path(lab_abs_path)) as f:
+            results_cache = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if results_cache.get('version') != RESULTS_CACHE_VERSION or \
+            results_cache.get('settings_hash') != hash_settings(settings):
+        return {}
+    return results_cache['submissions']
+
+
+def save_results_cache(lab_abs_path, settings, submissions):
+    results_cache = {
+        'version': RESULTS_CACHE_VERSION,
+        'settings_hash': hash_settings(settings),
+        'submissions': submissions
+    }
+    with atomic_write(get_results_cache_path(lab_abs_path)) as out_file:
+        json.dump(results_cache, out_file)
+
+
+def get_cached_results(previous_results, binary_hash):
+    """
+    Returns a copy of the stored test cases results of a submission if it was stored for the same executable
+    """
+    if not previous_results or previous_results['binary_hash'] != binary_hash:
+        return {}
+    return dict(previous_results['test_cases'])
+
+
+def create_entry(binary_hash, test_cases_results):
+    return {
+        'binary_hash': binary_hash,
+        'test_cases': test_cases_results
+    }
+
+
+def merge_entry(stored_entry, new_entry):
+    """
+    Adds the test cases results of new_entry to the stored entry of the same executable so that a run of
+    some of the test cases (public test cases, sampled test cases) doesn't drop the results of the others
+    """
+    if not stored_entry or stored_entry['binary_hash'] != new_entry['binary_hash']:
+        return new_entry
+    return create_entry(new_entry['binary_hash'], {**stored_entry['test_cases'], **new_entry['test_cases']})
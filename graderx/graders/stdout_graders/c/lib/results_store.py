@@ -0,0 +1,297 @@
+import sqlite3
+import zlib
+from ....app_config import GRADES_COLUMNS, RESULT_OUTPUT_COMPRESSION_MIN_SIZE
+from ....lib.atomic_files import atomic_replace
+from ...stdout_common.lib.test_cases_pack import sort_test_cases_ids
+
+
+SCHEMA = """
+CREATE TABLE meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE submissions (
+    id TEXT PRIMARY KEY,
+    grade REAL NOT NULL,
+    passed_count INTEGER NOT NULL,
+    failed_count INTEGER NOT NULL,
+    failed_ids TEXT NOT NULL,
+    wall_time REAL NOT NULL,
+    cpu_time REAL NOT NULL,
+    max_rss INTEGER
+);
+CREATE TABLE outputs (
+    hash TEXT PRIMARY KEY,
+    content BLOB NOT NULL,
+    compressed INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE failed_cases (
+    submission TEXT NOT NULL,
+    tc_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    output_hash TEXT NOT NULL REFERENCES outputs(hash),
+    expected_hash TEXT NOT NULL REFERENCES outputs(hash),
+    output_truncated INTEGER NOT NULL,
+    PRIMARY KEY (submission, tc_id)
+);
+CREATE INDEX failed_cases_tc_id ON failed_cases (tc_id);
+CREATE TABLE resources (
+    submission TEXT NOT NULL,
+    tc_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    wall_time REAL NOT NULL,
+    user_time REAL NOT NULL,
+    system_time REAL NOT NULL,
+    max_rss INTEGER,
+    PRIMARY KEY (submission, tc_id)
+);
+"""
+
+
+# Characters of the output of a failures cluster included in the clusters report
+CLUSTER_OUTPUT_PREVIEW_LENGTH = 1024
+FAILED_CASE_COLUMNS = "failed_cases.tc_id, output_hash, expected_hash, output_truncated"
+FAILED_CASE_JOINS = "FROM failed_cases JOIN outputs AS output ON output.hash = output_hash " \
+                    "JOIN outputs AS expected ON expected.hash = expected_hash"
+
+
+def get_results_store_path(lab_abs_path):
+    return lab_abs_path.joinpath(f'{lab_abs_path.name}_results.sqlite3')
+
+
+def write_results_store(lab_abs_path, submissions_list, diff, outputs, grades_summary, test_cases_count):
+    """
+    Stores the diff records and outputs returned by compute_results.deduplicate_outputs
+    in an sqlite database indexed by submission id, every distinct output is stored once
+    (compressed if it's large enough) and the failed test cases refer to it by its hash
+    the database is built in a temporary file that replaces the previous one so readers
+    always see the results of a whole run
+    failed_ids are separated by spaces, wall_time and cpu_time are the totals over all the test cases
+    and max_rss is the peak over all of them, it's NULL if it isn't known for any of them
+    """
+    with atomic_replace(get_results_store_path(lab_abs_path)) as tmp_path:
+        connection = sqlite3.connect(tmp_path)
+        try:
+            with connection:
+                connection.executescript(SCHEMA)
+                connection.execute(
+                    "INSERT INTO meta (key, value) VALUES ('total_test_cases_count', ?)", (str(test_cases_count),))
+                connection.executemany(
+                    "INSERT INTO submissions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (get_grades_row(item, grades_summary[item['id']]) for item in submissions_list))
+                connection.executemany(
+                    "INSERT INTO outputs VALUES (?, ?, ?, ?)",
+                    ((output_hash, *encode_output(output)) for output_hash, output in outputs.items()))
+                connection.executemany(
+                    "INSERT INTO failed_cases VALUES (?, ?, ?, ?, ?, ?)",
+                    ((item['id'], failed['tc_id'], position, failed['output_hash'], failed['expected_hash'],
+                      int(failed.get('output_truncated', False)))
+                     for item in diff for position, failed in enumerate(item['failed'])))
+                connection.executemany(
+                    "INSERT INTO resources VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    ((item['id'], run['tc_id'], position, run['wall_time'], run['user_time'], run['system_time'],
+                      run['max_rss'])
+                     for item in diff for position, run in enumerate(item.get('resources', []))))
+        finally:
+            connection.close()
+
+
+def encode_output(output):
+    """
+    Returns the content, compressed flag and size (in characters) of an output to store it
+    """
+    content = output.encode()
+    if RESULT_OUTPUT_COMPRESSION_MIN_SIZE is not None and len(content) >= RESULT_OUTPUT_COMPRESSION_MIN_SIZE:
+        compressed_content = zlib.compress(content)
+        if len(compressed_content) < len(content):
+            return compressed_content, 1, len(output)
+    return content, 0, len(output)
+
+
+def decode_output(content, compressed):
+    return (zlib.decompress(content) if compressed else content).decode()
+
+
+def get_grades_row(item, grade):
+    resources = item.get('resources', [])
+    return (
+        item['id'],
+        grade,
+        len(item['passed']),
+        len(item['failed']),
+        ' '.join(failed['tc_id'] for failed in item['failed']),
+        round(sum(run['wall_time'] for run in resources), 6),
+        round(sum(run['user_time'] + run['system_time'] for run in resources), 6),
+        get_max_rss(resources)
+    )
+
+
+def get_max_rss(runs):
+    """
+    Runs killed for exceeding the runtime or output limit have no max_rss
+    """
+    return max((run['max_rss'] for run in runs if run['max_rss'] is not None), default=None)
+
+
+def connect(lab_abs_path):
+    """
+    Opens the lab's results store read only, raises FileNotFoundError if the lab wasn't graded yet
+    """
+    store_path = get_results_store_path(lab_abs_path)
+    if not store_path.exists():
+        raise FileNotFoundError(store_path)
+    connection = sqlite3.connect(f"{store_path.as_uri()}?mode=ro", uri=True)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+def iter_grades(lab_abs_path):
+    """
+    Returns an iterator of the grades rows (dicts) ordered by submission id,
+    the rows are fetched from the store one at a time
+    """
+    connection = connect(lab_abs_path)
+    return iter_rows(connection, f"SELECT {', '.join(GRADES_COLUMNS)} FROM submissions ORDER BY id")
+
+
+def iter_rows(connection, query, parameters=()):
+    """
+    Yields the rows of the query as dicts then closes the connection
+    """
+    try:
+        for row in connection.execute(query, parameters):
+            yield dict(row)
+    finally:
+        connection.close()
+
+
+def get_diff_page(lab_abs_path, offset=0, limit=20, submission_id=None, tc_id=None, metadata_only=False):
+    """
+    Returns a page of the diff results in the format of the diff json file along with
+    the number of submissions that match the filters:
+    {"total_test_cases_count": 10, "total": 300, "offset": 0, "limit": 20, "diff": [{"id", "failed", "resources"}]}
+    submission_id only keeps that submission, tc_id only keeps the submissions that failed that test case
+    and only that test case in their "failed" array
+    The failed test cases have the hashes of their output and expected output, identical outputs have the same hash,
+    if metadata_only is True they have the sizes of the outputs instead of their content,
+    which is fetched with get_failed_case
+    """
+    filters, parameters = [], []
+    if submission_id is not None:
+        filters.append("id = ?")
+        parameters.append(submission_id)
+    if tc_id is not None:
+        filters.append("id IN (SELECT submission FROM failed_cases WHERE tc_id = ?)")
+        parameters.append(tc_id)
+    where = f"WHERE {' AND '.join(filters)}" if filters else ""
+    if metadata_only:
+        output_columns = "output.size AS output_size, expected.size AS expected_size"
+    else:
+        output_columns = "output.content AS output, output.compressed AS output_compressed, " \
+                         "expected.content AS expected, expected.compressed AS expected_compressed"
+    connection = connect(lab_abs_path)
+    try:
+        total_test_cases_count = int(connection.execute(
+            "SELECT value FROM meta WHERE key = 'total_test_cases_count'").fetchone()["value"])
+        total = connection.execute(f"SELECT COUNT(*) FROM submissions {where}", parameters).fetchone()[0]
+        submissions_ids = [row["id"] for row in connection.execute(
+            f"SELECT id FROM submissions {where} ORDER BY id LIMIT ? OFFSET ?", (*parameters, limit, offset))]
+        diff = []
+        for current_id in submissions_ids:
+            failed_query = f"SELECT {FAILED_CASE_COLUMNS}, {output_columns} {FAILED_CASE_JOINS} WHERE submission = ?"
+            failed_parameters = [current_id]
+            if tc_id is not None:
+                failed_query += " AND tc_id = ?"
+                failed_parameters.append(tc_id)
+            failed = [format_failed_case(row) for row in connection.execute(
+                failed_query + " ORDER BY position", failed_parameters)]
+            resources = [dict(row) for row in connection.execute(
+                "SELECT tc_id, wall_time, user_time, system_time, max_rss FROM resources "
+                "WHERE submission = ? ORDER BY position", (current_id,))]
+            diff.append({"id": current_id, "failed": failed, "resources": resources})
+    finally:
+        connection.close()
+    return {
+        "total_test_cases_count": total_test_cases_count,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "diff": diff
+    }
+
+
+def get_failed_case(lab_abs_path, submission_id, tc_id):
+    """
+    Returns the output and the expected output of a failed test case of a submission
+    or None if the submission didn't fail that test case
+    """
+    connection = connect(lab_abs_path)
+    try:
+        row = connection.execute(
+            f"SELECT {FAILED_CASE_COLUMNS}, output.content AS output, output.compressed AS output_compressed, "
+            f"expected.content AS expected, expected.compressed AS expected_compressed {FAILED_CASE_JOINS} "
+            "WHERE submission = ? AND tc_id = ?",
+            (submission_id, tc_id)).fetchone()
+    finally:
+        connection.close()
+    return format_failed_case(row) if row is not None else None
+
+
+def format_failed_case(row):
+    """
+    Converts a failed_cases row to the format of the diff json file, output_truncated is only kept if it's set
+    """
+    failed = dict(row)
+    for field in ("output", "expected"):
+        if field in failed:
+            failed[field] = decode_output(failed[field], failed.pop(f"{field}_compressed"))
+    if failed.pop("output_truncated"):
+        failed["output_truncated"] = True
+    return failed
+
+
+def get_failure_clusters(lab_abs_path, tc_id=None, preview_length=CLUSTER_OUTPUT_PREVIEW_LENGTH):
+    """
+    Groups the failed test cases by their test case and output hash, the submissions of a cluster
+    produced the same wrong output for the test case
+    Returns the clusters of every test case, the largest first, with the first preview_length characters
+    of their output (the whole output is fetched with get_failed_case of any of the cluster's submissions):
+    {"test_cases": [{"tc_id": "4", "failed_count": 40, "clusters": [
+        {"output_hash": "9b74c9...", "output": "...", "output_size": 12, "count": 35, "submissions": ["1111", ...]}
+    ]}]}
+    Only the hashes are grouped, the outputs are read once per cluster
+    """
+    query = "SELECT tc_id, output_hash, submission FROM failed_cases"
+    parameters = ()
+    if tc_id is not None:
+        query += " WHERE tc_id = ?"
+        parameters = (tc_id,)
+    connection = connect(lab_abs_path)
+    try:
+        clusters = {}
+        for row in connection.execute(query + " ORDER BY tc_id, output_hash, submission", parameters):
+            clusters.setdefault(row["tc_id"], {}).setdefault(row["output_hash"], []).append(row["submission"])
+        test_cases = []
+        for current_tc_id in sort_test_cases_ids(clusters):
+            tc_clusters = []
+            for output_hash, submissions in clusters[current_tc_id].items():
+                content, compressed, size = connection.execute(
+                    "SELECT content, compressed, size FROM outputs WHERE hash = ?", (output_hash,)).fetchone()
+                cluster = {
+                    "output_hash": output_hash,
+                    "output": decode_output(content, compressed)[:preview_length],
+                    "output_size": size,
+                    "count": len(submissions),
+                    "submissions": submissions
+                }
+                tc_clusters.append(cluster)
+            tc_clusters.sort(key=lambda cluster: -cluster["count"])
+            test_cases.append({
+                "tc_id": current_tc_id,
+                "failed_count": sum(cluster["count"] for cluster in tc_clusters),
+                "clusters": tc_clusters
+            })
+    finally:
+        connection.close()
+    return {"test_cases": test_cases}
@@ -0,0 +1,253 @@
+import os
+import resource
+import selectors
+import signal
+import subprocess
+import time
+from .launcher import get_launcher_path, get_alloc_guard_path
+
+
+READ_CHUNK_SIZE = 64 * 1024
+WRITE_CHUNK_SIZE = 64 * 1024
+# Fraction of the memory limit that a process killed by a signal must have used to be reported as exceeding it
+MEMORY_LIMIT_USAGE_THRESHOLD = 0.9
+
+# Resource limits that can be set on the executed process and the rlimit enforcing each of them
+RLIMITS = {
+    # Bytes of address space
+    "memory": resource.RLIMIT_AS,
+    # Seconds of cpu time, the process gets SIGXCPU when it exceeds it
+    "cpu_time": resource.RLIMIT_CPU,
+    # Processes owned by the grader's user (all of them, not only the ones started by the process)
+    "processes": resource.RLIMIT_NPROC,
+    # Bytes of the largest file the process may write, the process gets SIGXFSZ when it exceeds it
+    "file_size": resource.RLIMIT_FSIZE
+}
+
+
+def run_executable(cmd, cwd, stdin_data, timeout=None, output_limit=None, resource_limits=None):
+    """
+    Runs cmd feeding it stdin_data and reads its stdout while it's running,
+    stdin_data is either a bytes-like object written to the process through a pipe
+    or an open file that becomes the process's stdin so that the process reads it without passing through python
+    at most output_limit bytes of stdout are kept, the process is killed as soon as it writes more
+    than that or as soon as it runs for more than timeout seconds
+    resource_limits is a dict with some of the keys of RLIMITS, they're set on the process before it starts
+    and "limit_exceeded" is the key of the limit that caused the process to fail if it can be told
+    (see get_exceeded_limit), "allocation_failed" tells if a malloc, calloc or realloc of the process failed
+    while it ran under a memory limit
+    stderr isn't used by the graders so it's discarded instead of being buffered
+    The process is reaped with wait4 to get the resources it used, times are in seconds and max_rss in KiB
+    cmd is started by the launcher (see launcher/launcher.c) which reports the peak resident size of cmd alone,
+    max_rss is None if it isn't known because the process was killed for exceeding the timeout or output limit
+    Returns a dict:
+    {
+        "stdout": b"...",
+        "returncode": 0,
+        "timed_out": False,
+        "output_limit_exceeded": False,
+        "limit_exceeded": None,
+        "allocation_failed": False,
+        "resources": {"wall_time": 0.0021, "user_time": 0.001, "system_time": 0.0005, "max_rss": 1480}
+    }
+    """
+    stdin_is_file = hasattr(stdin_data, "fileno")
+    report_read_fd, report_write_fd = os.pipe()
+    start_time = time.monotonic()
+    try:
+        process = subprocess.Popen(
+            get_launcher_command(report_write_fd, cmd, resource_limits), cwd=cwd,
+            stdin=stdin_data if stdin_is_file else subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, pass_fds=(report_write_fd,), start_new_session=True)
+    except BaseException:
+        os.close(report_read_fd)
+        raise
+    finally:
+        os.close(report_write_fd)
+    deadline = start_time + timeout if timeout else None
+    result = {
+        "stdout": b"",
+        "returncode": None,
+        "timed_out": False,
+        "output_limit_exceeded": False,
+        "limit_exceeded": None,
+        "allocation_failed": False,
+        "resources": None
+    }
+    stdout_chunks = []
+    stdout_size = 0
+    stdin_view = memoryview(b"" if stdin_is_file else stdin_data)
+    written = 0
+
+    with selectors.DefaultSelector() as selector:
+        if len(stdin_view):
+            os.set_blocking(process.stdin.fileno(), False)
+            selector.register(process.stdin, selectors.EVENT_WRITE)
+        elif process.stdin:
+            process.stdin.close()
+        selector.register(process.stdout, selectors.EVENT_READ)
+
+        while selector.get_map():
+            remaining = get_remaining_time(deadline)
+            if remaining is not None and remaining <= 0:
+                result["timed_out"] = True
+                break
+            for key, _ in selector.select(remaining):
+                if key.fileobj is process.stdin:
+                    try:
+                        written += os.write(key.fd, stdin_view[written:written + WRITE_CHUNK_SIZE])
+                    except BlockingIOError:
+                        continue
+                    except BrokenPipeError:
+                        # The program exited or closed its stdin without reading the whole input
+                        written = len(stdin_view)
+                    if written >= len(stdin_view):
+                        selector.unregister(process.stdin)
+                        process.stdin.close()
+                else:
+                    chunk = os.read(key.fd, READ_CHUNK_SIZE)
+                    if not chunk:
+                        selector.unregister(process.stdout)
+                        continue
+                    stdout_chunks.append(chunk)
+                    stdout_size += len(chunk)
+                    if output_limit is not None and stdout_size > output_limit:
+                        result["output_limit_exceeded"] = True
+                        break
+            if result["output_limit_exceeded"]:
+                break
+
+    rusage = None
+    if not result["timed_out"] and not result["output_limit_exceeded"]:
+        rusage = wait_for_process(process, deadline)
+        if rusage is None:
+            result["timed_out"] = True
+    if rusage is None:
+        kill_process_group(process)
+        rusage = wait_for_process(process, None)
+    end_time = time.monotonic()
+    for pipe in (process.stdin, process.stdout):
+        if pipe and not pipe.closed:
+            pipe.close()
+    max_rss, result["allocation_failed"] = read_launcher_report(report_read_fd)
+
+    stdout = b"".join(stdout_chunks)
+    result["stdout"] = stdout[:output_limit] if output_limit is not None else stdout
+    result["returncode"] = process.returncode
+    result["resources"] = {
+        "wall_time": round(end_time - start_time, 6),
+        "user_time": round(rusage.ru_utime, 6),
+        "system_time": round(rusage.ru_stime, 6),
+        "max_rss": max_rss
+    }
+    if resource_limits and not result["timed_out"] and not result["output_limit_exceeded"]:
+        result["limit_exceeded"] = get_exceeded_limit(
+            process.returncode, result["resources"], resource_limits, result["allocation_failed"])
+    return result
+
+
+def get_launcher_command(report_fd, cmd, resource_limits=None):
+    """
+    Returns the launcher command that runs cmd with the given limits, the limits are set by the launcher
+    in the process it forks right before executing cmd, and the alloc guard is preloaded under a memory limit
+    """
+    launcher_cmd = [str(get_launcher_path()), str(report_fd)]
+    for limit, value in (resource_limits or {}).items():
+        # The cpu time hard limit is a second later so that the process gets SIGXCPU before SIGKILL
+        hard_value = value + 1 if limit == "cpu_time" else value
+        launcher_cmd += ["-l", f"{int(RLIMITS[limit])}:{int(value)}:{int(hard_value)}"]
+    if resource_limits and "memory" in resource_limits:
+        launcher_cmd += ["-g", str(get_alloc_guard_path())]
+    return [*launcher_cmd, "--", *cmd]
+
+
+def read_launcher_report(report_fd):
+    """
+    Reads the peak resident size and the allocation failure flag written by the launcher and closes report_fd,
+    returns (None, False) if the launcher was killed before writing them
+    """
+    os.set_blocking(report_fd, False)
+    try:
+        report = os.read(report_fd, 64)
+    except BlockingIOError:
+        report = b""
+    finally:
+        os.close(report_fd)
+    try:
+        max_rss, allocation_failed = report.split()
+        return int(max_rss), allocation_failed == b"1"
+    except ValueError:
+        return None, False
+
+
+def get_exceeded_limit(returncode, resources, resource_limits, allocation_failed=False):
+    """
+    Tells which of the resource limits made the process fail, the cpu time and file size limits are
+    reported by signals
+    The memory limit is blamed when an allocation of the process failed, or when the process was killed
+    by a signal after its own peak resident size got close to the limit (a stack overflow),
+    a process that failed for any other reason isn't reported as exceeding it
+    A process that failed to fork because of the processes limit can't be told apart from other failures
+    """
+    if returncode == 0:
+        return None
+    if "cpu_time" in resource_limits:
+        cpu_time = resources["user_time"] + resources["system_time"]
+        if returncode == -signal.SIGXCPU or (returncode == -signal.SIGKILL and cpu_time >= resource_limits["cpu_time"]):
+            return "cpu_time"
+    if "file_size" in resource_limits and returncode == -signal.SIGXFSZ:
+        return "file_size"
+    if "memory" in resource_limits:
+        if allocation_failed:
+            return "memory"
+        if returncode < 0 and resources["max_rss"] is not None and \
+                resources["max_rss"] * 1024 >= resource_limits["memory"] * MEMORY_LIMIT_USAGE_THRESHOLD:
+            return "memory"
+    return None
+
+
+def wait_for_process(process, deadline):
+    """
+    Reaps the process using wait4 and sets its returncode, returns its resource usage
+    or None if it's still running when the deadline is reached
+    """
+    if deadline is None:
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = get_returncode(status)
+        return rusage
+    delay = 0.0005
+    while True:
+        pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+        if pid == process.pid:
+            process.returncode = get_returncode(status)
+            return rusage
+        remaining = get_remaining_time(deadline)
+        if remaining <= 0:
+            return None
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 0.05)
+
+
+def get_returncode(status):
+    """
+    Converts a wait status to a returncode the way subprocess does, -N if the process was killed by signal N
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def get_remaining_time(deadline):
+    if deadline is None:
+        return None
+    return max(0, deadline - time.monotonic())
+
+
+def kill_process_group(process):
+    """
+    Kills the process along with any process it started, they share its session's process group
+    """
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
@@ -1,17 +1,20 @@
-import re
-from pathlib import Path
+from ...stdout_common.lib import test_cases_pack
 
 
-def get_test_cases(lab_path, public_testcases):
-    test_cases = []
-    pattern = re.compile('_in$')
-    for f in lab_path.joinpath('test_cases').iterdir():
-        if f.is_file and pattern.search(f.name):
-            test_case_id = f.name.split('_')[0]
-            if public_testcases and test_case_id not in public_testcases:
-                continue
-            test_case_in = f.read_text()
-            test_case_out = lab_path.joinpath(
-                f'test_cases/{test_case_id}_out').read_text()
-            test_cases.append((test_case_id, test_case_in, test_case_out))
-    return test_cases
+def get_test_cases(lab_path, public_testcases, refresh=True):
+    """
+    Returns a list of (id, input, output, hash, input_file) tuples of the lab's test cases,
+    input and output are memoryviews of the lab's memory mapped test cases pack
+    input_file identifies the test case's input file, see open_input
+    the hash identifies the content of the test case and is used as its key in the results cache
+    """
+    pack = test_cases_pack.get_test_cases_pack(lab_path, refresh)
+    return pack.get_test_cases(set(public_testcases) if public_testcases else None)
+
+
+def hash_test_case(test_case_in, test_case_out):
+    return test_cases_pack.hash_test_case(test_case_in, test_case_out)
+
+
+def open_input(test_case):
+    return test_cases_pack.open_input(test_case)
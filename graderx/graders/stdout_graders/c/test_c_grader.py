@@ -0,0 +1,422 @@
+from . import c_grader
+from .lib import compile_submission
+from .lib import test_cases_parser as tc_parser
+from .lib import run_submission
+from .lib import launcher
+from .lib import compute_results
+from .lib.compile_cache import CompileCache
+from ..stdout_common.lib import test_cases_pack
+from ..stdout_common import stdout_common
+import pytest
+import json
+import shutil
+import subprocess
+from pathlib import Path
+from unittest.mock import patch
+
+
+CORRECT_SOLUTION = """
+#include <stdio.h>
+int main() {
+    int a, b;
+    scanf("%d %d", &a, &b);
+    printf("%d\\n", a + b);
+    return 0;
+}
+"""
+
+WRONG_SOLUTION = """
+#include <stdio.h>
+int main() {
+    int a, b;
+    scanf("%d %d", &a, &b);
+    printf("%d\\n", a - b);
+    return 0;
+}
+"""
+
+TEST_CASES = [("1", "1 2", "3\n"), ("2", "5 0", "5\n"), ("3", "10 20", "30\n")]
+
+
+def add_submission(lab_path, submission_id, code):
+    submission_path = lab_path.joinpath(f"submissions/{submission_id}")
+    submission_path.mkdir(parents=True)
+    submission_path.joinpath("main.c").write_text(code)
+    submission_path.joinpath("commands.yml").write_text("compile: gcc main.c -o main\n")
+
+
+@pytest.fixture
+def lab_path(tmp_path, monkeypatch):
+    if shutil.which("gcc") is None:
+        pytest.skip("gcc is not available")
+    lab_path = tmp_path.joinpath("lab1")
+    test_cases_path = lab_path.joinpath("test_cases")
+    test_cases_path.mkdir(parents=True)
+    for tc_id, tc_in, tc_out in TEST_CASES:
+        test_cases_path.joinpath(f"{tc_id}_in").write_text(tc_in)
+        test_cases_path.joinpath(f"{tc_id}_out").write_text(tc_out)
+    add_submission(lab_path, "1111", CORRECT_SOLUTION)
+    add_submission(lab_path, "2222", WRONG_SOLUTION)
+    monkeypatch.setattr(c_grader, "get_lab_path", lambda course, lab: lab_path)
+    monkeypatch.setattr(compile_submission, "compile_cache",
+                        CompileCache(tmp_path.joinpath("compile_cache"), 1024 * 1024))
+    # The spawned grading workers create their compile cache from the environment
+    monkeypatch.setenv("GRADERX_COMPILE_CACHE_DIR", str(tmp_path.joinpath("compile_cache")))
+    return lab_path
+
+
+def read_diff_results(lab_path):
+    return {item["id"]: item for item in compute_results.read_diff_json(lab_path)["diff"]}
+
+
+@pytest.mark.parametrize("workers, test_case_workers", [(1, 1), (2, 1), (1, 3)])
+def test_run_grader_grades_all_submissions(lab_path, workers, test_case_workers):
+    c_grader.run_grader("course", "lab1", runtime_limit=5, workers=workers, test_case_workers=test_case_workers)
+    diff_results = read_diff_results(lab_path)
+    assert diff_results["1111"]["failed"] == []
+    assert sorted(failed["tc_id"] for failed in diff_results["2222"]["failed"]) == ["1", "3"]
+    tc_ids = [tc[0] for tc in tc_parser.get_test_cases(lab_path, None)]
+    assert [resources["tc_id"] for resources in diff_results["2222"]["resources"]] == tc_ids
+    summary = lab_path.joinpath("lab1_result_summary.txt").read_text()
+    assert "1111:100.0" in summary and "2222:33.33" in summary
+
+
+def test_compile_cache_reuses_binaries_of_unchanged_submissions(lab_path):
+    c_grader.run_grader("course", "lab1", runtime_limit=5)
+    lab_path.joinpath("submissions/2222/main.c").write_text(CORRECT_SOLUTION)
+    c_grader.run_grader("course", "lab1", runtime_limit=5)
+    stats = compile_submission.compile_cache.get_stats()
+    assert stats["hits"] == 2 and stats["misses"] == 2 and stats["entries"] == 2
+    assert read_diff_results(lab_path)["2222"]["failed"] == []
+
+
+def test_incremental_grading_only_runs_changed_test_cases(lab_path, monkeypatch):
+    c_grader.run_grader("course", "lab1", runtime_limit=5)
+    lab_path.joinpath("test_cases/2_out").write_text("6\n")
+    executed = []
+    run_test_case = c_grader.run_test_case
+
+    def counting_run_test_case(submission_dir, tc, settings):
+        executed.append((Path(submission_dir).name, tc[0]))
+        return run_test_case(submission_dir, tc, settings)
+
+    monkeypatch.setattr(c_grader, "run_test_case", counting_run_test_case)
+    c_grader.run_grader("course", "lab1", runtime_limit=5, incremental=True)
+    assert sorted(executed) == [("1111", "2"), ("2222", "2")]
+    diff_results = read_diff_results(lab_path)
+    assert [failed["tc_id"] for failed in diff_results["1111"]["failed"]] == ["2"]
+    assert len(diff_results["2222"]["failed"]) == 3
+
+
+def test_public_test_cases_runs_keep_the_cached_results_of_the_others(lab_path, monkeypatch):
+    c_grader.run_grader("course", "lab1", runtime_limit=5)
+    c_grader.run_grader("course", "lab1", runtime_limit=5, public_testcases=["1"])
+    executed = []
+    run_test_case = c_grader.run_test_case
+
+    def counting_run_test_case(submission_dir, tc, settings):
+        executed.append((Path(submission_dir).name, tc[0]))
+        return run_test_case(submission_dir, tc, settings)
+
+    monkeypatch.setattr(c_grader, "run_test_case", counting_run_test_case)
+    c_grader.run_grader("course", "lab1", runtime_limit=5, incremental=True)
+    assert executed == []
+
+
+def test_comparison_modes_allow_trailing_whitespace(lab_path):
+    lab_path.joinpath("test_cases/1_out").write_text("3   \n\n\n")
+    c_grader.run_grader("course", "lab1", runtime_limit=5)
+    assert [failed["tc_id"] for failed in read_diff_results(lab_path)["1111"]["failed"]] == ["1"]
+    report = lab_path.joinpath("submissions/1111/1111_results.txt").read_text()
+    assert "-3   " in report or "+3   " in report
+    c_grader.run_grader("course", "lab1", runtime_limit=5, comparison_modes=["trailing_whitespace"])
+    assert read_diff_results(lab_path)["1111"]["failed"] == []
+
+
+def test_crlf_test_cases_are_compared_like_text(lab_path):
+    lab_path.joinpath("test_cases/1_in").write_bytes(b"1 2\r\n")
+    lab_path.joinpath("test_cases/1_out").write_bytes(b"3\r\n")
+    c_grader.run_grader("course", "lab1", runtime_limit=5)
+    assert read_diff_results(lab_path)["1111"]["failed"] == []
+    # The normalised input is given to the submission instead of the file
+    tc = tc_parser.get_test_cases(lab_path, ["1"])[0]
+    assert (bytes(tc[1]), bytes(tc[2])) == (b"1 2\n", b"3\n")
+    with tc_parser.open_input(tc) as input_file:
+        assert input_file is None
+
+
+INFINITE_OUTPUT_SOLUTION = """
+#include <stdio.h>
+int main() {
+    while (1) printf("spam spam spam spam\\n");
+    return 0;
+}
+"""
+
+INFINITE_LOOP_SOLUTION = """
+int main() {
+    while (1);
+    return 0;
+}
+"""
+
+
+def test_output_and_runtime_limits_are_reported(lab_path):
+    add_submission(lab_path, "3333", INFINITE_OUTPUT_SOLUTION)
+    add_submission(lab_path, "4444", INFINITE_LOOP_SOLUTION)
+    c_grader.run_grader("course", "lab1", runtime_limit=1, output_limit=1024)
+    diff_results = read_diff_results(lab_path)
+    assert {failed["output"] for failed in diff_results["3333"]["failed"]} == {"OUTPUT LIMIT EXCEEDED"}
+    assert {failed["output"] for failed in diff_results["4444"]["failed"]} == {"RUNTIME LIMIT EXCEEDED"}
+
+
+def test_resources_are_recorded_for_every_test_case(lab_path):
+    c_grader.run_grader("course", "lab1", runtime_limit=5)
+    resources = read_diff_results(lab_path)["1111"]["resources"]
+    assert sorted(r["tc_id"] for r in resources) == ["1", "2", "3"]
+    assert all(r["wall_time"] > 0 and r["max_rss"] > 0 for r in resources)
+    with open(lab_path.joinpath("lab1_chart_result.json")) as f:
+        tc_resources = json.load(f)["tc_resources"]
+    assert sorted((r["tc_id"], r["runs"]) for r in tc_resources) == [("1", 2), ("2", 2), ("3", 2)]
+
+
+def test_max_rss_is_the_peak_of_the_submission_alone(lab_path):
+    # The grader's own resident memory isn't counted in the submission's peak
+    ballast = bytearray(128 * 1024 * 1024)
+    for index in range(0, len(ballast), 4096):
+        ballast[index] = 1
+    execution = run_submission.run_executable(["true"], lab_path, b"", timeout=5)
+    assert execution["returncode"] == 0
+    assert 0 < execution["resources"]["max_rss"] < 32 * 1024
+    execution = run_submission.run_executable(["sleep", "5"], lab_path, b"", timeout=0.2)
+    assert execution["timed_out"] and execution["resources"]["max_rss"] is None
+
+
+FAILING_SOLUTION = """
+int main() {
+    return 1;
+}
+"""
+
+HUGE_ALLOCATION_SOLUTION = """
+#include <stdio.h>
+#include <stdlib.h>
+int main() {
+    char *buffer = malloc(1024 * 1024 * 1024);
+    if (buffer == NULL) {
+        return 1;
+    }
+    buffer[0] = 1;
+    printf("%d\\n", buffer[0]);
+    return 0;
+}
+"""
+
+REPEATED_FAILED_ALLOCATIONS_SOLUTION = """
+#include <stdlib.h>
+int main() {
+    int failed = 0;
+    for (int i = 0; i < 200000; i++) {
+        failed += malloc(1024 * 1024 * 1024) == NULL;
+    }
+    return failed > 0;
+}
+"""
+
+
+def run_compiled(lab_path, code, **options):
+    lab_path.joinpath("main.c").write_text(code)
+    subprocess.run(["gcc", "main.c", "-o", "main"], cwd=lab_path, check=True)
+    return run_submission.run_executable(["./main"], lab_path, b"", timeout=5, **options)
+
+
+def test_the_launcher_is_built_once_per_process(lab_path):
+    launcher.get_launcher_path.cache_clear()
+    with patch.object(launcher, "build", wraps=launcher.build) as build:
+        for _ in range(3):
+            assert run_submission.run_executable(["true"], lab_path, b"")["returncode"] == 0
+    assert build.call_count == 1
+
+
+def test_memory_limit_is_only_reported_when_it_was_exceeded(lab_path):
+    execution = run_compiled(lab_path, FAILING_SOLUTION, resource_limits={"memory": 40 * 1024 * 1024})
+    assert execution["returncode"] == 1
+    assert execution["limit_exceeded"] is None
+    execution = run_compiled(lab_path, HUGE_ALLOCATION_SOLUTION, resource_limits={"memory": 256 * 1024 * 1024})
+    assert execution["returncode"] == 1
+    assert execution["allocation_failed"]
+    assert execution["limit_exceeded"] == "memory"
+    # More failures than the pipe to the launcher can hold don't block the submission until its timeout
+    execution = run_compiled(
+        lab_path, REPEATED_FAILED_ALLOCATIONS_SOLUTION, resource_limits={"memory": 256 * 1024 * 1024})
+    assert not execution["timed_out"] and execution["returncode"] == 1
+    assert execution["limit_exceeded"] == "memory"
+    # Without the limit the allocation succeeds
+    execution = run_compiled(lab_path, HUGE_ALLOCATION_SOLUTION)
+    assert execution["returncode"] == 0 and execution["limit_exceeded"] is None
+
+
+FILE_WRITING_SOLUTION = """
+#include <stdio.h>
+int main() {
+    FILE *f = fopen("big_file", "w");
+    for (int i = 0; i < 100000; i++) fprintf(f, "0123456789");
+    fclose(f);
+    printf("3\\n");
+    return 0;
+}
+"""
+
+
+def test_resource_limits_are_reported_as_distinct_statuses(lab_path):
+    add_submission(lab_path, "3333", FILE_WRITING_SOLUTION)
+    add_submission(lab_path, "4444", INFINITE_LOOP_SOLUTION)
+    c_grader.run_grader("course", "lab1", runtime_limit=5,
+                        resource_limits={"file_size": 1024, "cpu_time": 1})
+    diff_results = read_diff_results(lab_path)
+    assert {failed["output"] for failed in diff_results["3333"]["failed"]} == {"FILE SIZE LIMIT EXCEEDED"}
+    assert {failed["output"] for failed in diff_results["4444"]["failed"]} == {"CPU LIMIT EXCEEDED"}
+
+
+def test_diff_files_with_inline_outputs_are_still_read(tmp_path):
+    lab_path = tmp_path.joinpath("lab1")
+    lab_path.mkdir()
+    diff_json = {"total_test_cases_count": 3, "diff": [
+        {"id": "2222", "failed": [{"tc_id": "1", "output": "-1\n", "expected": "3\n"}], "resources": []}]}
+    lab_path.joinpath("lab1_diff_result.json").write_text(json.dumps(diff_json))
+    assert compute_results.read_diff_json(lab_path) == diff_json
+
+
+def test_fail_fast_skips_the_test_cases_after_the_first_failure(lab_path):
+    c_grader.run_grader("course", "lab1", runtime_limit=5, fail_fast=True)
+    diff_results = read_diff_results(lab_path)
+    assert diff_results["1111"]["failed"] == []
+    failed = diff_results["2222"]["failed"]
+    tc_ids = [tc[0] for tc in tc_parser.get_test_cases(lab_path, None)]
+    first_failure = next(index for index, tc_id in enumerate(tc_ids) if tc_id != "2")
+    assert [f["tc_id"] for f in failed] == tc_ids[first_failure:]
+    assert all(f["output"] == "NOT RUN" for f in failed[1:])
+
+
+def test_fail_fast_keeps_the_cached_results_after_the_first_failure(lab_path):
+    c_grader.run_grader("course", "lab1", runtime_limit=5)
+    full_results = read_diff_results(lab_path)["2222"]
+    c_grader.run_grader("course", "lab1", runtime_limit=5, incremental=True, fail_fast=True)
+    diff_results = read_diff_results(lab_path)["2222"]
+    assert diff_results["failed"] == full_results["failed"]
+    assert all(f["output"] != "NOT RUN" for f in diff_results["failed"])
+
+
+def test_sampled_grading_is_reproducible(lab_path):
+    for submission_id in ("3333", "4444", "5555"):
+        add_submission(lab_path, submission_id, CORRECT_SOLUTION)
+    c_grader.run_grader("course", "lab1", runtime_limit=5)
+    sampled = []
+    for _ in range(2):
+        c_grader.run_grader("course", "lab1", runtime_limit=5, sample_submissions=2, sample_test_cases=1,
+                            sample_seed=7)
+        # The lab's results of the full run are kept
+        assert len(read_diff_results(lab_path)) == 5
+        diff_results = read_diff_results(c_grader.get_sample_results_path(lab_path))
+        assert len(diff_results) == 2
+        assert all(len(item["resources"]) == 1 for item in diff_results.values())
+        sampled.append({submission_id: item["resources"][0]["tc_id"] for submission_id, item in diff_results.items()})
+    assert sampled[0] == sampled[1]
+    assert [item["id"] for item in c_grader.get_diff_results_file("course", "lab1", sample=True)["diff"]] == \
+        list(diff_results)
+    assert sorted(row["id"] for row in c_grader.get_grades("course", "lab1", sample=True)) == sorted(diff_results)
+    assert len(list(c_grader.get_grades("course", "lab1"))) == 5
+
+
+def test_deleting_a_lab_deletes_its_sampled_results(lab_path, monkeypatch):
+    c_grader.run_grader("course", "lab1", runtime_limit=5, sample_submissions=1)
+    sample_results_path = c_grader.get_sample_results_path(lab_path)
+    assert sample_results_path.exists()
+    monkeypatch.setattr(stdout_common, "get_lab_path", lambda course, lab: lab_path)
+    stdout_common.delete_lab("course", "lab1")
+    assert not lab_path.exists() and not sample_results_path.exists()
+
+
+def test_test_cases_are_packed_and_repacked_when_they_change(lab_path):
+    test_cases = tc_parser.get_test_cases(lab_path, None)
+    assert lab_path.joinpath("test_cases.pack").exists()
+    assert [(tc[0], bytes(tc[1]), bytes(tc[2])) for tc in test_cases] == [
+        (tc_id, tc_in.encode(), tc_out.encode()) for tc_id, tc_in, tc_out in TEST_CASES]
+    assert all(isinstance(tc[1], memoryview) for tc in test_cases)
+    assert test_cases[0][3] == tc_parser.hash_test_case(b"1 2", b"3\n")
+    lab_path.joinpath("test_cases/2_out").write_text("55\n")
+    assert [bytes(tc[2]) for tc in tc_parser.get_test_cases(lab_path, ["2"])] == [b"55\n"]
+
+
+def test_test_cases_cache_is_reused_until_the_lab_changes(lab_path, monkeypatch):
+    cache = test_cases_pack.PackedTestCasesCache(1024 * 1024)
+    monkeypatch.setattr(test_cases_pack, "packs_cache", cache)
+    for _ in range(3):
+        tc_parser.get_test_cases(lab_path, None)
+    assert cache.get_stats()["hits"] == 2 and cache.get_stats()["entries"] == 1
+    lab_path.joinpath("test_cases/4_in").write_text("1 1")
+    lab_path.joinpath("test_cases/4_out").write_text("2\n")
+    assert len(tc_parser.get_test_cases(lab_path, None)) == 4
+    cache.invalidate(lab_path)
+    assert cache.get_stats()["entries"] == 0 and cache.get_stats()["misses"] == 2
+
+
+def test_submissions_read_the_test_case_input_files_directly(lab_path):
+    tc = tc_parser.get_test_cases(lab_path, ["1"])[0]
+    with tc_parser.open_input(tc) as input_file:
+        assert input_file is not None
+        execution = run_submission.run_executable(["cat"], lab_path, input_file)
+    assert execution["stdout"] == b"1 2"
+    lab_path.joinpath("test_cases/1_in").write_text("2 2")
+    with tc_parser.open_input(tc) as input_file:
+        assert input_file is None
+    c_grader.run_grader("course", "lab1", runtime_limit=5)
+    assert read_diff_results(lab_path)["1111"]["failed"][0]["tc_id"] == "1"
+
+
+def test_grades_are_stored_by_submission_id(lab_path):
+    c_grader.run_grader("course", "lab1", runtime_limit=5)
+    grades = list(c_grader.get_grades("course", "lab1"))
+    assert [(row["id"], row["grade"], row["passed_count"], sorted(row["failed_ids"].split())) for row in grades] == [
+        ("1111", 100.0, 3, []), ("2222", 33.33, 1, ["1", "3"])]
+    assert all(row["wall_time"] > 0 and row["max_rss"] > 0 for row in grades)
+
+
+def test_diff_results_are_paginated_and_filtered(lab_path):
+    add_submission(lab_path, "3333", WRONG_SOLUTION)
+    c_grader.run_grader("course", "lab1", runtime_limit=5)
+    page = c_grader.get_diff_page("course", "lab1", offset=1, limit=1)
+    assert page["total"] == 3 and [item["id"] for item in page["diff"]] == ["2222"]
+    page = c_grader.get_diff_page("course", "lab1", tc_id="3", metadata_only=True)
+    assert [item["id"] for item in page["diff"]] == ["2222", "3333"]
+    output_hash, expected_hash = compute_results.hash_output("-10\n"), compute_results.hash_output("30\n")
+    assert [item["failed"] for item in page["diff"]] == [[{
+        "tc_id": "3", "output_hash": output_hash, "expected_hash": expected_hash, "output_size": 4, "expected_size": 3
+    }]] * 2
+    assert len(page["diff"][0]["resources"]) == 3
+    assert c_grader.get_failed_case("course", "lab1", "2222", "3") == {
+        "tc_id": "3", "output_hash": output_hash, "expected_hash": expected_hash, "output": "-10\n", "expected": "30\n"}
+    assert c_grader.get_failed_case("course", "lab1", "1111", "3") is None
+
+
+def test_identical_outputs_are_stored_once(lab_path):
+    long_output = "x" * 4096
+    lab_path.joinpath("test_cases/2_out").write_text(long_output)
+    add_submission(lab_path, "3333", WRONG_SOLUTION)
+    c_grader.run_grader("course", "lab1", runtime_limit=5)
+    with open(lab_path.joinpath("lab1_diff_result.json")) as f:
+        diff_json = json.load(f)
+    assert sorted(diff_json["outputs"].values()) == sorted(["5\n", "-1\n", "-10\n", "3\n", "30\n", long_output])
+    assert read_diff_results(lab_path)["3333"]["failed"][1] == {"tc_id": "2", "output": "5\n", "expected": long_output}
+    assert c_grader.get_failed_case("course", "lab1", "1111", "2")["expected"] == long_output
+
+
+def test_failures_are_clustered_by_identical_output(lab_path):
+    add_submission(lab_path, "3333", WRONG_SOLUTION)
+    c_grader.run_grader("course", "lab1", runtime_limit=5)
+    clusters = c_grader.get_failure_clusters("course", "lab1")["test_cases"]
+    assert [(tc["tc_id"], tc["failed_count"]) for tc in clusters] == [("1", 2), ("3", 2)]
+    assert clusters[0]["clusters"] == [{
+        "output_hash": compute_results.hash_output("-1\n"), "output": "-1\n", "output_size": 3, "count": 2,
+        "submissions": ["2222", "3333"]}]
+    assert c_grader.get_failure_clusters("course", "lab1", tc_id="2") == {"test_cases": []}
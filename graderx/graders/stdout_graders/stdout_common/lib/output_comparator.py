@@ -0,0 +1,120 @@
+import difflib
+import math
+import re
+from enum import Enum
+from itertools import zip_longest
+
+
+DEFAULT_FLOAT_TOLERANCE = 1e-6
+FINAL_NEW_LINE = b"\n"
+# re searches memoryviews without copying them, the in operator of a memoryview compares single bytes
+CARRIAGE_RETURN = re.compile(rb"\r")
+OTHER_NEW_LINES = re.compile(rb"\r\n?")
+
+
+class COMPARISON_MODES(Enum):
+    """
+    Normalisations applied line by line before comparing a submission's output to the expected output
+    """
+    # Ignore whitespace at the end of every line and empty lines at the end of the output
+    TRAILING_WHITESPACE = "trailing_whitespace"
+    # Treat \r\n line endings as \n, it's always done (see normalize_newlines) and only kept for existing labs
+    LINE_ENDINGS = "line_endings"
+    # Compare the whitespace separated tokens of every line, numbers may differ by float_tolerance
+    FLOAT_TOLERANCE = "float_tolerance"
+
+
+def outputs_match(output, expected, comparison_modes=None, float_tolerance=None):
+    """
+    Compares a submission's output to the expected output, both are bytes-like objects
+    The new lines of both are normalised (see normalize_newlines) then identical outputs are detected
+    by a plain bytes comparison, the lines are only normalised and compared one by one
+    when comparison modes are given and the outputs differ
+    """
+    output, expected = normalize_newlines(output), normalize_newlines(expected)
+    if output == expected:
+        return True
+    if not comparison_modes:
+        return False
+    # The expected output may be a memoryview of the test cases pack, lines are only split on bytes
+    output, expected = bytes(output), bytes(expected)
+    if float_tolerance is None:
+        float_tolerance = DEFAULT_FLOAT_TOLERANCE
+    if COMPARISON_MODES.FLOAT_TOLERANCE.value in comparison_modes:
+        compare_line = lines_match_with_tolerance
+    else:
+        compare_line = lambda output_line, expected_line, _: output_line == expected_line
+    for output_line, expected_line in zip_longest(
+            iter_lines(output, comparison_modes), iter_lines(expected, comparison_modes)):
+        if output_line is None or expected_line is None:
+            return False
+        if not compare_line(output_line, expected_line, float_tolerance):
+            return False
+    return True
+
+
+def normalize_newlines(data):
+    """
+    Converts \\r\\n and \\r to \\n the way files read in text mode are,
+    data is returned as it is (without being copied) when it has no \\r
+    """
+    if CARRIAGE_RETURN.search(data) is None:
+        return data
+    return OTHER_NEW_LINES.sub(b"\n", data)
+
+
+def iter_lines(data, comparison_modes):
+    """
+    Yields the normalised lines of data one at a time without splitting the whole output at once
+    """
+    ignore_trailing_whitespace = COMPARISON_MODES.TRAILING_WHITESPACE.value in comparison_modes
+    # Empty lines are held back until a non-empty line follows them so that trailing ones can be dropped
+    pending_empty_lines = 0
+    start = 0
+    data_length = len(data)
+    while start < data_length:
+        end = data.find(b"\n", start)
+        if end == -1:
+            end = data_length
+        line = data[start:end]
+        start = end + 1
+        if ignore_trailing_whitespace:
+            line = line.rstrip()
+        if ignore_trailing_whitespace and not line:
+            pending_empty_lines += 1
+            continue
+        for _ in range(pending_empty_lines):
+            yield b""
+        pending_empty_lines = 0
+        yield line
+    if not ignore_trailing_whitespace and data.endswith(b"\n"):
+        # Lines never contain a new line so this distinguishes outputs that only differ by a final new line
+        yield FINAL_NEW_LINE
+
+
+def lines_match_with_tolerance(output_line, expected_line, float_tolerance):
+    if output_line == expected_line:
+        return True
+    output_tokens = output_line.split()
+    expected_tokens = expected_line.split()
+    if len(output_tokens) != len(expected_tokens):
+        return False
+    for output_token, expected_token in zip(output_tokens, expected_tokens):
+        if output_token == expected_token:
+            continue
+        try:
+            if not math.isclose(float(output_token), float(expected_token),
+                                rel_tol=float_tolerance, abs_tol=float_tolerance):
+                return False
+        except ValueError:
+            return False
+    return True
+
+
+def build_line_diff(output, expected):
+    """
+    Returns a unified line diff between a submission's output and the expected output (both str),
+    it's only meant to be built for reporting a failed test case
+    """
+    return '\n'.join(difflib.unified_diff(
+        output.splitlines(), expected.splitlines(), fromfile='output', tofile='expected', lineterm=''))
@@ -0,0 +1,237 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from ....app_config import TEST_CASES_CACHE_MAX_SIZE
+from ....lib.atomic_files import atomic_write
+from .output_comparator import normalize_newlines
+
+
+PACK_FILENAME = "test_cases.pack"
+MAGIC = b"GXTCPACK3\n"
+# The index is stored after the data, followed by its length so that the pack is written in a single pass
+INDEX_LENGTH_FORMAT = ">Q"
+INDEX_LENGTH_SIZE = struct.calcsize(INDEX_LENGTH_FORMAT)
+
+
+class PackedTestCases:
+    """
+    A lab's test cases packed in a single file that is memory mapped,
+    the inputs and outputs are returned as memoryviews of the mapping so they're never copied
+    The pack's index has the offsets, lengths and content hash of every test case along with
+    the modification time of its input file when the pack was built (None if the packed input differs
+    from the file because its new lines were normalised):
+    {"signature": "...", "test_cases": [[id, in_offset, in_length, out_offset, out_length, hash, in_mtime], ...]}
+    """
+
+    def __init__(self, pack_path):
+        self.test_cases_path = Path(pack_path).parent.joinpath("test_cases")
+        with open(pack_path, "rb") as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # An empty file can't be mapped
+                raise InvalidPackedTestCasesError(pack_path)
+        if len(self._mmap) < len(MAGIC) + INDEX_LENGTH_SIZE or self._mmap[:len(MAGIC)] != MAGIC:
+            raise InvalidPackedTestCasesError(pack_path)
+        index_end = len(self._mmap) - INDEX_LENGTH_SIZE
+        index_length, = struct.unpack(INDEX_LENGTH_FORMAT, self._mmap[index_end:])
+        try:
+            index = json.loads(self._mmap[max(index_end - index_length, len(MAGIC)):index_end])
+        except ValueError:
+            raise InvalidPackedTestCasesError(pack_path)
+        self.signature = index["signature"]
+        self.index = index["test_cases"]
+        self._view = memoryview(self._mmap)
+        self.size = len(self._mmap)
+
+    def get_test_cases(self, test_cases_ids=None):
+        """
+        Returns (id, input, output, hash, input_file) tuples in the pack's order,
+        only the test cases in test_cases_ids if it's given
+        input_file is (path, size, modification time) of the input file the pack was built from, see open_input
+        """
+        return [
+            (tc_id, self._view[in_offset:in_offset + in_length], self._view[out_offset:out_offset + out_length],
+             tc_hash, (str(self.test_cases_path.joinpath(f"{tc_id}_in")), in_length, in_mtime))
+            for tc_id, in_offset, in_length, out_offset, out_length, tc_hash, in_mtime in self.index
+            if not test_cases_ids or tc_id in test_cases_ids]
+
+
+@contextmanager
+def open_input(test_case):
+    """
+    Opens the input file of a test case tuple so that it can be given to a process as its stdin,
+    yields None instead if the file no longer has the content packed for the test case
+    or if the packed input was normalised
+    """
+    path, size, mtime = test_case[4]
+    if mtime is None:
+        yield None
+        return
+    try:
+        input_file = open(path, "rb")
+    except OSError:
+        yield None
+        return
+    with input_file:
+        stat = os.fstat(input_file.fileno())
+        yield input_file if (stat.st_size, stat.st_mtime_ns) == (size, mtime) else None
+
+
+def sort_test_cases_ids(test_cases_ids):
+    """
+    Sorts the ids numerically when they're numbers
+    """
+    return sorted(test_cases_ids, key=lambda tc_id: (not tc_id.isdigit(), int(tc_id) if tc_id.isdigit() else 0, tc_id))
+
+
+def hash_test_case(test_case_in, test_case_out):
+    return hashlib.sha256(
+        hashlib.sha256(test_case_in).digest() + hashlib.sha256(test_case_out).digest()).hexdigest()
+
+
+def get_directory_signature(test_cases_path):
+    """
+    Identifies the content of the test cases directory using the names, sizes and modification times
+    of its files so that a changed directory is detected without reading the files
+    """
+    signature = hashlib.sha256()
+    for entry in sorted(os.scandir(test_cases_path), key=lambda entry: entry.name):
+        if entry.name.endswith(("_in", "_out")) and entry.is_file():
+            stat = entry.stat()
+            signature.update(f"{entry.name}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return signature.hexdigest()
+
+
+class PackedTestCasesCache:
+    """
+    Keeps the opened packs of the most recently used labs while their total size is at most max_size bytes,
+    a pack is only reused while it has the signature of the lab's test cases directory
+    Every process has its own cache, labs are invalidated eagerly when they're edited
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._packs = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, lab_path, signature=None):
+        """
+        Returns the cached pack of the lab or None if it isn't cached or its signature differs,
+        a signature of None accepts any cached pack
+        """
+        with self._lock:
+            pack = self._packs.get(lab_path)
+            if pack is None or (signature is not None and pack.signature != signature):
+                self.misses += 1
+                return None
+            self._packs.move_to_end(lab_path)
+            self.hits += 1
+            return pack
+
+    def put(self, lab_path, pack):
+        with self._lock:
+            self._remove(lab_path)
+            if pack.size > self.max_size:
+                return
+            self._packs[lab_path] = pack
+            self._size += pack.size
+            while self._size > self.max_size:
+                self._remove(next(iter(self._packs)))
+
+    def invalidate(self, lab_path):
+        with self._lock:
+            self._remove(lab_path)
+
+    def _remove(self, lab_path):
+        # The memoryviews handed out keep the mapping of a removed pack alive until they're released
+        pack = self._packs.pop(lab_path, None)
+        if pack is not None:
+            self._size -= pack.size
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "entries": len(self._packs),
+                "size": self._size,
+                "max_size": self.max_size
+            }
+
+
+packs_cache = PackedTestCasesCache(TEST_CASES_CACHE_MAX_SIZE)
+
+
+def get_test_cases_pack(lab_path, refresh=True):
+    """
+    Returns the lab's PackedTestCases, the pack is (re)built from [lab_path/test_cases/] the first time
+    it's used and whenever the directory changes, a pack without a test cases directory is used as it is
+    refresh=False skips checking the directory, it's used by grading workers that already checked it
+    """
+    lab_path = Path(lab_path).resolve()
+    pack_path = lab_path.joinpath(PACK_FILENAME)
+    test_cases_path = lab_path.joinpath("test_cases")
+    signature = None
+    if refresh and test_cases_path.exists():
+        signature = get_directory_signature(test_cases_path)
+    elif not pack_path.exists():
+        raise FileNotFoundError(test_cases_path)
+    pack = packs_cache.get(lab_path, signature)
+    if pack is not None:
+        return pack
+    pack = None
+    try:
+        pack = PackedTestCases(pack_path)
+    except (FileNotFoundError, InvalidPackedTestCasesError):
+        if signature is None:
+            raise
+    if signature is not None and (pack is None or pack.signature != signature):
+        build_pack(test_cases_path, pack_path, signature)
+        pack = PackedTestCases(pack_path)
+    packs_cache.put(lab_path, pack)
+    return pack
+
+
+def build_pack(test_cases_path, pack_path, signature):
+    """
+    Packs the _in/_out files of test_cases_path into pack_path, the pack is written to a temporary file
+    that replaces pack_path so readers never see a partial pack
+    The new lines of the inputs and outputs are normalised like the graders did when they read them as text
+    """
+    ids = sort_test_cases_ids(f.name[:-len("_in")] for f in test_cases_path.iterdir() if f.name.endswith("_in"))
+    index = []
+    with atomic_write(pack_path, "wb") as pack_file:
+        pack_file.write(MAGIC)
+        offset = len(MAGIC)
+        for tc_id in ids:
+            in_mtime = test_cases_path.joinpath(f"{tc_id}_in").stat().st_mtime_ns
+            file_in = test_cases_path.joinpath(f"{tc_id}_in").read_bytes()
+            test_case_in = normalize_newlines(file_in)
+            if test_case_in is not file_in:
+                # The submission is given the packed input instead of the file, see open_input
+                in_mtime = None
+            test_case_out = normalize_newlines(test_cases_path.joinpath(f"{tc_id}_out").read_bytes())
+            pack_file.write(test_case_in)
+            pack_file.write(test_case_out)
+            index.append([tc_id, offset, len(test_case_in), offset + len(test_case_in), len(test_case_out),
+                          hash_test_case(test_case_in, test_case_out), in_mtime])
+            offset += len(test_case_in) + len(test_case_out)
+        index_data = json.dumps({"signature": signature, "test_cases": index}).encode()
+        pack_file.write(index_data)
+        pack_file.write(struct.pack(INDEX_LENGTH_FORMAT, len(index_data)))
+
+
+class InvalidPackedTestCasesError(Exception):
+    pass
@@ -1,6 +1,7 @@
 from pathlib import Path
 import json
 from .lib import test_cases_parser as tc_parser
+from .lib import test_cases_pack
 import shutil
 from ...app_config import LAB_GUIDE_FILENAME
 
@@ -36,6 +37,8 @@ def clear_test_cases(course, lab):
     test_cases_path = Path(__file__).joinpath(f"../../../courses/{course}/labs/{lab}/test_cases").resolve()
     if test_cases_path.exists():
         shutil.rmtree(str(test_cases_path))
+    # The pack would be used as the lab's test cases if it was kept without the test cases directory
+    test_cases_path.parent.joinpath(test_cases_pack.PACK_FILENAME).unlink(missing_ok=True)
 
 def create_lab_guide(course, lab, lab_guide_file):
     lab_path = get_lab_path(course, lab)
@@ -47,6 +50,13 @@ def get_lab_path(course, lab):
     return Path(__file__).joinpath(
         f'../../../courses/{course}/labs/{lab}').resolve()
 
+def get_sample_results_path(lab_path):
+    """
+    Sampled runs write their results to [labs/.samples/<lab>/] instead of the lab's directory,
+    the directory has the lab's name since the results files are named after it
+    """
+    return lab_path.parent.joinpath(".samples", lab_path.name)
+
 def get_course_path(course):
     return Path(__file__).joinpath(
         f'../../../courses/{course}').resolve()
@@ -58,8 +68,74 @@ def get_test_cases(course, lab):
     test_cases_tuples = tc_parser.get_test_cases(lab_path)
     return [{"id": tc[0],"input": tc[1], "output": tc[2]} for tc in test_cases_tuples]
 
+def get_test_cases_ids(lab_path):
+    """
+    Returns the ids of the lab's test cases sorted numerically when they're numbers
+    """
+    test_cases_path = lab_path.joinpath('test_cases')
+    if not test_cases_path.exists():
+        return []
+    return test_cases_pack.sort_test_cases_ids(
+        f.name[:-len('_in')] for f in test_cases_path.iterdir() if f.name.endswith('_in'))
+
+
+def get_test_cases_summary(course, lab):
+    """
+    Returns the number of test cases of the lab and the total size in bytes of their inputs and outputs,
+    only the files' metadata is read
+    """
+    lab_path = get_lab_path(course, lab)
+    summary = {"count": 0, "input_size": 0, "output_size": 0}
+    for tc_id in get_test_cases_ids(lab_path):
+        summary["count"] += 1
+        summary["input_size"] += lab_path.joinpath(f'test_cases/{tc_id}_in').stat().st_size
+        output_path = lab_path.joinpath(f'test_cases/{tc_id}_out')
+        if output_path.exists():
+            summary["output_size"] += output_path.stat().st_size
+    return summary
+
+
+def get_test_cases_page(course, lab, offset=0, limit=20, start=0, length=None):
+    """
+    Returns up to limit test cases starting from the offset-th one along with the total number of test cases
+    Only the bytes [start, start + length) of every input and output are read,
+    their full sizes are returned so that the client can request the rest of them
+    """
+    lab_path = get_lab_path(course, lab)
+    ids = get_test_cases_ids(lab_path)
+    test_cases = []
+    for tc_id in ids[offset:offset + limit]:
+        test_case = {"id": tc_id}
+        for field, suffix in (("input", "_in"), ("output", "_out")):
+            file_path = lab_path.joinpath(f'test_cases/{tc_id}{suffix}')
+            test_case[f"{field}_size"] = file_path.stat().st_size if file_path.exists() else 0
+            test_case[field] = read_file_range(file_path, start, length) if file_path.exists() else ""
+        test_cases.append(test_case)
+    return {"test_cases": test_cases, "total": len(ids), "offset": offset, "limit": limit}
+
+
+def read_file_range(file_path, start, length):
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        data = f.read() if length is None else f.read(length)
+    return data.decode(errors='replace')
+
+
+def invalidate_test_cases(course, lab):
+    """
+    Drops the lab's test cases from the cache of this process, called after the lab's test cases are edited
+    """
+    test_cases_pack.packs_cache.invalidate(get_lab_path(course, lab))
+
+
+def get_test_cases_cache_stats():
+    return test_cases_pack.packs_cache.get_stats()
+
+
 def delete_course(course_name):
     shutil.rmtree(str(get_course_path(course_name)))
 
 def delete_lab(course, lab):
-    shutil.rmtree(str(get_lab_path(course, lab)))
\ No newline at end of file
+    lab_path = get_lab_path(course, lab)
+    shutil.rmtree(str(get_sample_results_path(lab_path)), ignore_errors=True)
+    shutil.rmtree(str(lab_path))
\ No newline at end of file
@@ -5,7 +5,11 @@ import string
 from pathlib import Path
 import patoolib
 import os
+import json
+import threading
+import time
 import werkzeug.datastructures
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import Mock, patch
 
 
@@ -58,3 +62,106 @@ def test_extraction_return_if_extract_file_fails(monkeypatch):
 
     with pytest.raises(manager.ArchiveDamagedError):
         manager.extract_submissions(Mock(), Mock())
+
+
+def test_courses_config_is_only_parsed_again_when_the_file_changes(tmp_path, monkeypatch):
+    config_path = tmp_path.joinpath("courses_config.json")
+    config_path.write_text('{"course": {"type": "stdout", "variant": "c", "labs": []}}')
+    store = manager.ConfigStore(config_path)
+    monkeypatch.setattr(manager, 'courses_config_store', store)
+    courses_config = manager.get_courses_config()
+    courses_config["course"]["labs"].append({"name": "lab1"})
+    assert manager.get_courses_config()["course"]["labs"] == []
+    with patch.object(manager.json, 'loads', wraps=manager.json.loads) as loads:
+        manager.get_courses_config()
+        loads.assert_not_called()
+    manager.update_course_config(courses_config)
+    assert manager.get_courses_config()["course"]["labs"] == [{"name": "lab1"}]
+    assert [path.name for path in tmp_path.iterdir()] == ["courses_config.json"]
+    config_path.write_text('{"other_course": {"type": "stdout", "variant": "c", "labs": []}}')
+    assert manager.get_courses_config_if_course_exists("other_course")
+
+
+def test_courses_config_keeps_its_permissions_when_written(tmp_path, monkeypatch):
+    config_path = tmp_path.joinpath("courses_config.json")
+    config_path.write_text('{"course": {"type": "stdout", "variant": "c", "labs": []}}')
+    config_path.chmod(0o640)
+    monkeypatch.setattr(manager, 'courses_config_store', manager.ConfigStore(config_path))
+    manager.update_course_config(manager.get_courses_config())
+    assert config_path.stat().st_mode & 0o777 == 0o640
+
+
+def test_sqlite_catalog_is_migrated_from_the_json_config(tmp_path, monkeypatch):
+    config = {
+        "course": {"type": "stdout", "variant": "c", "labs": [
+            {"name": "lab1", "runtime_limit": 2, "disable_internet": False, "public_test_cases": ["2"]},
+            {"name": "lab2", "runtime_limit": 3, "disable_internet": False}]},
+        "removed_test_course": {"type": "unittest", "variant": "pytest", "labs": []}
+    }
+    config_path = tmp_path.joinpath("courses_config.json")
+    config_path.write_text(json.dumps(config))
+    test_cases_path = tmp_path.joinpath("course/lab1/test_cases")
+    test_cases_path.mkdir(parents=True)
+    for tc_id in ("1", "2"):
+        test_cases_path.joinpath(f"{tc_id}_in").write_text("")
+        test_cases_path.joinpath(f"{tc_id}_out").write_text("")
+    catalog = manager.SqliteCatalog(tmp_path.joinpath("catalog.sqlite3"))
+    catalog.migrate_json_config(config_path, lambda course, lab: tmp_path.joinpath(course, lab))
+    monkeypatch.setattr(manager, 'courses_config_store', catalog)
+    assert manager.get_courses_config() == config
+    assert manager.get_public_testcases("course", "lab1") == ["2"]
+    with pytest.raises(manager.LabNotFoundError):
+        manager.get_lab_object("course", "lab3")
+    with pytest.raises(manager.CourseNotFoundError):
+        manager.get_lab_object("course2", "lab1")
+
+    catalog.put_lab("course", {"name": "lab1", "runtime_limit": 5, "disable_internet": False},
+                    [{"id": "1", "public": True}, {"id": "2", "public": False}])
+    catalog.delete_lab("course", "lab2")
+    catalog.migrate_json_config(config_path, lambda course, lab: tmp_path.joinpath(course, lab))
+    assert manager.get_course_object("course")["labs"] == [
+        {"name": "lab1", "runtime_limit": 5, "disable_internet": False, "public_test_cases": ["1"]}]
+    # Writing back what was read keeps the test cases that aren't public
+    manager.update_course_config(manager.get_courses_config())
+    assert [tuple(row) for row in catalog.get_connection().execute(
+        "SELECT id, public FROM test_cases WHERE course = 'course' ORDER BY position")] == [("1", 1), ("2", 0)]
+    deleted_courses = []
+    monkeypatch.setattr(manager.stdout_common, 'delete_course', deleted_courses.append)
+    manager.delete_course("removed_test_course")
+    assert deleted_courses == ["removed_test_course"]
+    assert manager.get_courses() == ["course"]
+
+
+def test_queued_jobs_of_a_lab_do_not_hold_the_workers(monkeypatch):
+    release_lab1 = threading.Event()
+    graded = []
+
+    def run_course_grader(course_grader, course_name, lab, *args):
+        if lab == "lab1":
+            assert release_lab1.wait(5)
+        graded.append(lab)
+
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(manager, 'grading_executor', executor)
+    monkeypatch.setattr(manager, 'get_lab_object', lambda course_name, lab: {})
+    monkeypatch.setattr(manager, 'select_course_grader', lambda course_name: Mock(GRADER_TYPE="stdout"))
+    monkeypatch.setattr(manager, 'run_course_grader', run_course_grader)
+    lab1_jobs = [manager.start_grading_job("course", "lab1") for _ in range(3)]
+    lab2_job = manager.start_grading_job("course", "lab2")
+    # The queued lab1 jobs wait outside the executor so lab2 gets the second worker
+    for _ in range(100):
+        if manager.get_grading_job(lab2_job)["status"] == "done":
+            break
+        time.sleep(0.05)
+    assert graded == ["lab2"]
+    assert [manager.get_grading_job(job)["status"] for job in lab1_jobs] == ["running", "queued", "queued"]
+
+    release_lab1.set()
+    for _ in range(100):
+        if all(manager.get_grading_job(job)["status"] == "done" for job in lab1_jobs):
+            break
+        time.sleep(0.05)
+    executor.shutdown(wait=True)
+    assert graded == ["lab2", "lab1", "lab1", "lab1"]
+    assert manager.lab_job_queues == {}
+    assert manager.lab_grading_locks == {}
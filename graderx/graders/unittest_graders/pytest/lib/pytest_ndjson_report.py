@@ -0,0 +1,64 @@
+"""
+pytest plugin that writes the result of every test as soon as it's known to the file given by
+the GRADERX_TEST_RESULTS_PATH environment variable, one json object per line:
+{"nodeid": "...", "test": "test_output", "submission": "1111", "when": "call",
+ "outcome": "passed" | "failed" | "skipped", "duration": 0.01, "traceback": "..."}
+It's loaded by pytest_grader with -p pytest_ndjson_report, see lib/results_report.py for the reader
+"""
+import json
+import os
+from pathlib import Path
+
+
+RESULTS_PATH_VARIABLE = "GRADERX_TEST_RESULTS_PATH"
+
+
+def get_submission_id(item):
+    """
+    The submission of a test is the name (without .py) of the first python file it's parametrized with,
+    or its parametrization id if it has no such parameter, tests that aren't parametrized have no submission
+    """
+    callspec = getattr(item, "callspec", None)
+    if callspec is None:
+        return None
+    for value in callspec.params.values():
+        if isinstance(value, (str, os.PathLike)) and str(value).endswith(".py"):
+            return Path(value).stem
+    return callspec.id
+
+
+class NdjsonReport:
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8")
+        self.submissions = {}
+
+    def pytest_collection_modifyitems(self, items):
+        for item in items:
+            self.submissions[item.nodeid] = (getattr(item, "originalname", None) or item.name,
+                                              get_submission_id(item))
+
+    def pytest_runtest_logreport(self, report):
+        # Passed setups and teardowns aren't results, a test fails if any of its phases fails
+        if report.when != "call" and not report.failed and not report.skipped:
+            return
+        test, submission = self.submissions.get(report.nodeid, (report.nodeid, None))
+        result = {
+            "nodeid": report.nodeid,
+            "test": test,
+            "submission": submission,
+            "when": report.when,
+            "outcome": report.outcome,
+            "duration": round(report.duration, 6),
+            "traceback": report.longreprtext if report.failed else ""
+        }
+        self.file.write(json.dumps(result) + "\n")
+        self.file.flush()
+
+    def pytest_sessionfinish(self):
+        self.file.close()
+
+
+def pytest_configure(config):
+    path = os.environ.get(RESULTS_PATH_VARIABLE)
+    if path:
+        config.pluginmanager.register(NdjsonReport(path), "graderx_ndjson_report")
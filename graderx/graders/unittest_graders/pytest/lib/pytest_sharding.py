@@ -0,0 +1,47 @@
+"""
+pytest plugin that keeps only one shard of the collected tests so that a lab can be graded
+by several pytest processes at the same time, it's loaded by pytest_grader with -p pytest_sharding
+The shard is given by the GRADERX_SHARD_INDEX and GRADERX_SHARDS_COUNT environment variables
+"""
+import os
+
+try:
+    from .pytest_ndjson_report import get_submission_id
+except ImportError:
+    # Loaded by pytest with -p pytest_sharding from the lib directory which isn't a package there
+    from pytest_ndjson_report import get_submission_id
+
+
+SHARD_INDEX_VARIABLE = "GRADERX_SHARD_INDEX"
+SHARDS_COUNT_VARIABLE = "GRADERX_SHARDS_COUNT"
+
+
+def get_shard_key(item):
+    """
+    The tests of a submission (the same key the results are grouped by, see get_submission_id)
+    are kept in the same shard, the tests that don't belong to a submission are sharded one by one
+    """
+    submission_id = get_submission_id(item)
+    return submission_id if submission_id is not None else item.nodeid
+
+
+def select_shard(keys, shard_index, shards_count):
+    """
+    Returns the keys of the shard, the distinct keys are sorted then dealt round robin between the shards
+    so every process computes the same shards from the same collected tests
+    """
+    return {key for position, key in enumerate(sorted(set(keys))) if position % shards_count == shard_index}
+
+
+def pytest_collection_modifyitems(config, items):
+    shards_count = int(os.environ.get(SHARDS_COUNT_VARIABLE, 1))
+    if shards_count <= 1:
+        return
+    shard_index = int(os.environ[SHARD_INDEX_VARIABLE])
+    shard_keys = select_shard((get_shard_key(item) for item in items), shard_index, shards_count)
+    selected, deselected = [], []
+    for item in items:
+        (selected if get_shard_key(item) in shard_keys else deselected).append(item)
+    if deselected:
+        config.hook.pytest_deselected(items=deselected)
+        items[:] = selected
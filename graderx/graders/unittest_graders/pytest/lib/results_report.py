@@ -0,0 +1,74 @@
+import csv
+import json
+
+
+def read_test_results(results_files):
+    """
+    Reads the ndjson files written by the pytest_ndjson_report plugin (in the given order) and returns
+    {submission: {test: {"outcome", "duration", "tracebacks"}}} in the order the tests were run,
+    a test failed if any of its phases failed and its duration is the sum of its phases' durations
+    Tests that don't belong to a submission are left out
+    """
+    results = {}
+    for results_file in results_files:
+        with open(results_file, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                if result["submission"] is None:
+                    continue
+                test = results.setdefault(result["submission"], {}).setdefault(
+                    result["test"], {"outcome": "passed", "duration": 0, "tracebacks": []})
+                test["duration"] = round(test["duration"] + result["duration"], 6)
+                if result["outcome"] == "failed":
+                    test["outcome"] = "failed"
+                    test["tracebacks"].append(result["traceback"])
+                elif result["outcome"] == "skipped" and test["outcome"] != "failed":
+                    test["outcome"] = "skipped"
+    return results
+
+
+def get_grade(tests):
+    """
+    The fraction of the submission's tests that passed, skipped tests don't count
+    """
+    outcomes = [test["outcome"] for test in tests.values() if test["outcome"] != "skipped"]
+    return round(outcomes.count("passed") / len(outcomes), 4) if outcomes else 0
+
+
+def write_reports(results, reports_path, lab):
+    """
+    Writes the 4 report files console_log_parser used to write to reports_path:
+    1- [LABNAME]_grade_summary.csv: "submission,grade" lines, the grade is a fraction (1 is the full mark)
+    2- [LABNAME]_report.csv: a header then a line per submission with the outcome of each test and the grade
+    3- [LABNAME]_crash_details.txt: the tracebacks of every failed test of every submission
+    4- [LABNAME]_short_crash_summary.txt: a "submission test FAILED duration" line per failed test
+    """
+    reports_path.mkdir(parents=True, exist_ok=True)
+    tests_names = []
+    for tests in results.values():
+        tests_names.extend(test for test in tests if test not in tests_names)
+    submissions = sorted(results)
+    with open(reports_path.joinpath(f"{lab}_grade_summary.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        for submission in submissions:
+            writer.writerow([submission, get_grade(results[submission])])
+    with open(reports_path.joinpath(f"{lab}_report.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["submission", *tests_names, "grade"])
+        for submission in submissions:
+            tests = results[submission]
+            writer.writerow([
+                submission,
+                *(tests[test]["outcome"].upper() if test in tests else "" for test in tests_names),
+                get_grade(tests)])
+    with open(reports_path.joinpath(f"{lab}_crash_details.txt"), "w") as details, \
+            open(reports_path.joinpath(f"{lab}_short_crash_summary.txt"), "w") as summary:
+        for submission in submissions:
+            for test, result in results[submission].items():
+                if result["outcome"] != "failed":
+                    continue
+                summary.write(f"{submission} {test} FAILED {result['duration']}s\n")
+                details.write(f"{'=' * 20} {submission} {test} {'=' * 20}\n")
+                details.write("\n".join(result["tracebacks"]) + "\n\n")
@@ -0,0 +1,66 @@
+import json
+import os
+import re
+from ....lib.atomic_files import atomic_write
+
+
+def get_index_path(submissions_path):
+    """
+    The index of [lab_path/submissions/<YEAR>] is kept next to it in [lab_path/submissions/<YEAR>_index.json]
+    """
+    return submissions_path.with_name(f"{submissions_path.name}_index.json")
+
+
+def get_index_keys(submission_name):
+    """
+    A submission is indexed by its name and by the ids found in it: every run of letters and digits
+    and every run of digits, so "2136_2315" is found by "2136_2315", "2136" and "2315"
+    """
+    return {submission_name, *re.findall(r"[A-Za-z0-9]+", submission_name), *re.findall(r"[0-9]+", submission_name)}
+
+
+def build_submissions_index(submissions_path):
+    """
+    Maps the ids found in the names of the python submissions to the names (without .py) of the submissions
+    and saves it along with the modification time of the submissions directory
+    {"mtime": 1600000000000000000, "submissions": {"2136": ["2136_2315"], "2136_2315": ["2136_2315"]}}
+    """
+    index = {}
+    mtime = os.stat(submissions_path).st_mtime_ns
+    for submission_file in sorted(submissions_path.glob("*.py")):
+        submission_name = submission_file.stem
+        for key in get_index_keys(submission_name):
+            index.setdefault(key, []).append(submission_name)
+    data = {"mtime": mtime, "submissions": index}
+    with atomic_write(get_index_path(submissions_path)) as f:
+        json.dump(data, f)
+    return data
+
+
+def load_submissions_index(submissions_path):
+    """
+    Returns the saved index of the submissions directory, it's built again if it doesn't exist
+    or if the directory changed since it was built (submissions were added, renamed or removed)
+    """
+    try:
+        with open(get_index_path(submissions_path)) as f:
+            data = json.load(f)
+    except (FileNotFoundError, ValueError):
+        data = None
+    if data is None or data["mtime"] != os.stat(submissions_path).st_mtime_ns:
+        data = build_submissions_index(submissions_path)
+    return data
+
+
+def get_submissions_names(data):
+    return sorted({name for names in data["submissions"].values() for name in names})
+
+
+def find_submissions(data, student, submissions_names):
+    """
+    Returns the names of the submissions of the student using the index,
+    ids that aren't an index key are searched for in submissions_names (see get_submissions_names)
+    """
+    if student in data["submissions"]:
+        return data["submissions"][student]
+    return [name for name in submissions_names if student in name]
@@ -2,19 +2,28 @@ from pathlib import Path
 import shlex
 import subprocess
 import os
+import shutil
+import tempfile
 from .lib.submissions_extraction import extract_submissions, clean_directory
+from .lib import pytest_sharding, pytest_ndjson_report, results_report, submissions_index
 import json
-import importlib.util
 
 from ...lib.helpers import GRADER_TYPES
 from ...lib.helpers import GRADER_VARIANTS
 from ...lib.helpers import GRADER_LANGUAGES 
+from ...lib.module_cache import load_config_module
+from ...app_config import GRADES_COLUMNS, GRADING_SCRATCH_PATH
 
 
 GRADER_TYPE = GRADER_TYPES.UNITTEST.value
 GRADER_VARIANT = GRADER_VARIANTS.PYTEST.value
 GRADER_LANGUAGE = GRADER_LANGUAGES.PYTHON.value
 
+# Added to the PYTHONPATH of the pytest processes so they can load the plugins in lib/ with -p
+PYTEST_PLUGINS_PATH = Path(__file__).parent.joinpath('lib')
+# The cache provider is disabled because the shards would all write to the same cache directory
+PYTEST_PLUGINS = ("pytest_sharding", "pytest_ndjson_report", "no:cacheprovider")
+
 
 def get_course_root(course):
     return Path(__file__).joinpath(
@@ -25,55 +34,79 @@ def get_lab_path(course, lab):
     return get_course_root(course).joinpath(lab)
 
 
+def get_course_config(course):
+    """
+    Returns the course's lib/app_config.py module, it's only executed again when the file changes
+    """
+    return load_config_module(get_course_root(course).joinpath('lib/app_config.py'))
+
+
 def get_course_year(course):
-    course_path = get_course_root(course)
-    spec = importlib.util.spec_from_file_location(
-        "module.name", 
-        course_path.joinpath('lib/app_config.py')
-    )
-    app_config = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(app_config)
-    return app_config.YEAR
+    return get_course_config(course).YEAR
 
 
-def run_grader(course, lab, student=False):
+def run_grader(course, lab, student=False, progress=None, workers=1):
     """
     Runs the tests in the given lab's corresponding pytest test file 
-    which is test_run_grader.py in each lab directory  
-    then saves the output in a file
-    then pipes the pytest output file to console_log_parser 
-    which will parse the pytest output to create 4 files
-    1- [TIMESTAMP]_[LABNAME]_crash_details.txt which contains 
+    which is test_run_grader.py in each lab directory
+    then creates 4 report files out of the results of the tests
+    1- [LABNAME]_crash_details.txt which contains 
     detailed pytest output of only the failed tests for all the submissions
-    2- [TIMESTAMP]_[LABNAME]_grade_summary.csv which contains
+    2- [LABNAME]_grade_summary.csv which contains
     the final grade of every submission
-    3- [TIMESTAMP]_[LABNAME]_report.csv which also contains
+    3- [LABNAME]_report.csv which also contains
     the grades but with specifiying which test passed and which didn't
-    4- [TIMESTAMP]_[LABNAME]_short_crash_summary.txt which contains
+    4- [LABNAME]_short_crash_summary.txt which contains
     a summarized info about the failed tests for all submissions
-    *(1) These files should be found inside {course_directory}/app/results/<YEAR>/{lab_name}
-    after grading any lab of that course
-    *(2) From GraderX point of view, results/ directory isn't used for anything, but there's a sibling res/
-    directory which will contain one or more of these 4 files which will be fetched for download when requested
+    *(1) The pytest output file is piped to the course's lib/console_log_parser.py which parses it
+    to create these files (with a [TIMESTAMP]_ prefix) inside {course_directory}/app/results/<YEAR>/{lab_name}
+    and in the sibling res/ directory which contains the files that will be fetched for download when requested,
+    From GraderX point of view, results/ directory isn't used for anything
+    *(2) Courses whose lib/app_config.py sets STRUCTURED_RESULTS = True (or that have no console_log_parser)
+    get the reports written by lib/results_report.py in res/{lab_name} instead, out of the results
+    collected by the pytest_ndjson_report plugin while the tests run, see uses_console_log_parser
+    *(3) progress, if given, is called with (graded submissions count, total submissions count),
+    it's called before the run and whenever a shard finishes
+    *(4) The pytest output and results are written to a scratch directory that is removed when the run ends,
+    the pytest and console_log_parser processes run inside it so the files they write to relative paths go there too
+    *(5) workers > 1 splits the tests between that many pytest processes (shards) that run at the same time,
+    the tests of a submission are kept in the same shard (see lib/pytest_sharding.py)
+    and the shards' outputs and results are concatenated in shard order
     """
     course_path = get_course_root(course)
+    course_config = get_course_config(course)
     lab_path = get_lab_path(course, lab)
-    lab_path_str = str(lab_path)
-    student_tests_filter = ""
-    # If "GRADERX_FJ" environment variable is set to "ENABLED"
-    # run the tests with the firejail profile in the lab directory else run normally
-    if student:
-        student_tests_filter = "-m student"
-    if ("GRADERX_FJ" in os.environ) and os.environ['GRADERX_FJ'] == "ENABLED":
-        cmd = shlex.split(
-            f"firejail --profile={lab_path_str}/firejail.profile pytest {student_tests_filter} -vv --tb=short --show-capture=no {lab_path_str}/test_run_grader.py")
-    else:
-        cmd = shlex.split(
-            f"pytest {student_tests_filter} -vv --tb=short --show-capture=no {lab_path_str}/test_run_grader.py")
-    file_name = "output.txt"
-    with open(file_name, "w+") as f:
-        subprocess.run(cmd, stdout=f)
-    parser_file = "parser_output"
+    submissions_count = len(list(lab_path.glob(f"submissions/{course_config.YEAR}/*.py")))
+    if progress:
+        progress(0, submissions_count)
+    # Every run has its own scratch directory for the intermediate files so that concurrent runs don't share them
+    with tempfile.TemporaryDirectory(prefix=f"graderx_{course}_{lab}_", dir=GRADING_SCRATCH_PATH) as scratch_path:
+        scratch_path = Path(scratch_path)
+        file_name = scratch_path.joinpath("output.txt")
+        results_file_name = scratch_path.joinpath("results.ndjson")
+        shards_count = max(1, min(workers, submissions_count))
+        run_shards(lab_path, student, shards_count, file_name, results_file_name, progress, submissions_count,
+                   cwd=scratch_path)
+        if uses_console_log_parser(course_path, course_config):
+            run_console_log_parser(course_path, lab, file_name, scratch_path.joinpath("parser_output"), cwd=scratch_path)
+        else:
+            results = results_report.read_test_results([results_file_name])
+            results_report.write_reports(results, course_path.joinpath(f'res/{lab}'), lab)
+    if progress:
+        progress(submissions_count, submissions_count)
+
+
+def uses_console_log_parser(course_path, course_config):
+    """
+    The structured reports grade a submission by the fraction of its tests that passed which may differ from
+    how the course's console_log_parser grades it, so a course only gets them when it asks for them
+    """
+    if getattr(course_config, 'STRUCTURED_RESULTS', False):
+        return False
+    return course_path.joinpath('lib/console_log_parser.py').exists()
+
+
+def run_console_log_parser(course_path, lab, file_name, parser_file, cwd=None):
     # Gets the lab number from the lab name (whatever after "lab" in the lab name)
     # examples: lab3 has a lab_number (3), lab1_client has a lab_number (1_client)
     lab_number = lab.split('lab')[-1]
@@ -86,7 +119,66 @@ def run_grader(course, lab, student=False):
             # the files in res/ are the ones that will be downloaded
             cmd = shlex.split(
                 f"python {course_path}/lib/console_log_parser.py {lab_number} {course_path}/res")
-            subprocess.run(cmd, stdin=fi, stdout=fo)
+            subprocess.run(cmd, stdin=fi, stdout=fo, cwd=cwd)
+
+
+def get_pytest_command(lab_path, student=False):
+    """
+    Returns the pytest command of the lab with the plugins in lib/ loaded,
+    if "GRADERX_FJ" environment variable is set to "ENABLED"
+    the tests run with the firejail profile in the lab directory else they run normally
+    """
+    lab_path_str = str(lab_path)
+    student_tests_filter = "-m student" if student else ""
+    plugins = " ".join(f"-p {plugin}" for plugin in PYTEST_PLUGINS)
+    cmd = f"pytest {plugins} {student_tests_filter} -vv --tb=short --show-capture=no {lab_path_str}/test_run_grader.py"
+    if ("GRADERX_FJ" in os.environ) and os.environ['GRADERX_FJ'] == "ENABLED":
+        cmd = f"firejail --profile={lab_path_str}/firejail.profile {cmd}"
+    return shlex.split(cmd)
+
+
+def run_shards(lab_path, student, shards_count, file_name, results_file_name, progress=None, submissions_count=0,
+               cwd=None):
+    """
+    Starts a pytest process (in its own firejail sandbox if it's enabled) for every shard in cwd,
+    each one writes its output and its ndjson results to its own files,
+    then they're concatenated to file_name and results_file_name in shard order
+    so the merged files don't depend on which shard finished first
+    """
+    cmd = get_pytest_command(lab_path, student)
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        path for path in (str(PYTEST_PLUGINS_PATH), os.environ.get("PYTHONPATH")) if path)
+    env[pytest_sharding.SHARDS_COUNT_VARIABLE] = str(shards_count)
+    shard_files = [
+        (f"{file_name}.{shard_index}", f"{results_file_name}.{shard_index}") for shard_index in range(shards_count)]
+    processes = []
+    try:
+        for shard_index, (shard_file, shard_results_file) in enumerate(shard_files):
+            env[pytest_sharding.SHARD_INDEX_VARIABLE] = str(shard_index)
+            env[pytest_ndjson_report.RESULTS_PATH_VARIABLE] = os.path.abspath(shard_results_file)
+            # The results file exists even if pytest fails before running any test
+            open(shard_results_file, "w").close()
+            with open(shard_file, "w+") as f:
+                processes.append(subprocess.Popen(cmd, stdout=f, env=dict(env), cwd=cwd))
+        for finished_count, process in enumerate(processes, 1):
+            process.wait()
+            if progress and finished_count < shards_count:
+                progress(submissions_count * finished_count // shards_count, submissions_count)
+        for merged_file, shard_index in ((file_name, 0), (results_file_name, 1)):
+            with open(merged_file, "wb") as f:
+                for files in shard_files:
+                    with open(files[shard_index], "rb") as shard_output:
+                        shutil.copyfileobj(shard_output, f)
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        for files in shard_files:
+            for shard_file in files:
+                if os.path.exists(shard_file):
+                    os.remove(shard_file)
 
 
 def add_submissions(course, lab, submissions_file):
@@ -96,11 +188,13 @@ def add_submissions(course, lab, submissions_file):
     """
     lab_path = get_lab_path(course, lab)
     lab_path_str = str(lab_path)
-    extract_submissions(Path(
-        f"{lab_path_str}/submissions/{get_course_year(course)}"), submissions_file)
+    submissions_path = Path(f"{lab_path_str}/submissions/{get_course_year(course)}")
+    extract_submissions(submissions_path, submissions_file)
+    submissions_index.build_submissions_index(submissions_path)
 
 
 def save_single_submission(course, lab, file_in_memory, filename):
+    # The submissions index is rebuilt once when it's next used instead of after every imported file
     lab_path = get_lab_path(course, lab)
     lab_path.joinpath(f'submissions/{get_course_year(course)}/{filename}').write_bytes(
         file_in_memory.getbuffer())
@@ -108,7 +202,9 @@ def save_single_submission(course, lab, file_in_memory, filename):
 
 def clear_submissions(course, lab):
     lab_path = get_lab_path(course, lab)
-    clean_directory(lab_path.joinpath(f"submissions/{get_course_year(course)}"))
+    submissions_path = lab_path.joinpath(f"submissions/{get_course_year(course)}")
+    clean_directory(submissions_path)
+    submissions_index.build_submissions_index(submissions_path)
 
 
 def results_to_download(course, lab):
@@ -121,6 +217,30 @@ def results_to_download(course, lab):
     return result_files_path
 
 
+def get_grades(course, lab):
+    """
+    Returns an iterator of the grades of the lab's submissions read from the grade summary csv,
+    only the submission id and the grade (percentage) are known, the other columns are None
+    """
+    grades_file_path = get_course_root(course).joinpath(f'res/{lab}/{lab}_grade_summary.csv')
+    grades_file = open(grades_file_path)
+    return iter_grades_file(grades_file)
+
+
+def iter_grades_file(grades_file):
+    with grades_file:
+        for line in grades_file:
+            fields = line.strip().split(',')
+            try:
+                grade = round(float(fields[1]) * 100, 2)
+            except (IndexError, ValueError):
+                # Empty or header lines
+                continue
+            row = dict.fromkeys(GRADES_COLUMNS)
+            row.update({"id": fields[0], "grade": grade})
+            yield row
+
+
 # TODO: delete it
 def get_diff_results_file(course_name, lab):
     path = Path("graderx").joinpath("graders").joinpath(
@@ -149,6 +269,10 @@ def get_submission_file_content(course, lab, submission_id, file_name):
 
 
 def get_not_fullmark_submissions(course, lab):
+    """
+    Returns the names of the submissions of the students who didn't get the full mark,
+    the students are matched with their submissions using the submissions index (see lib/submissions_index.py)
+    """
     lab_path = get_lab_path(course, lab)
     submissions_path = lab_path.joinpath(f"submissions/{get_course_year(course)}")
     grades_file_path = get_course_root(course).joinpath(
@@ -159,15 +283,11 @@ def get_not_fullmark_submissions(course, lab):
     for student in not_fullmark_students_with_grades:
         if float(student.split(',')[1]) < 1:
             not_fullmark_students.append(student.split(',')[0])
-    all_submissions_names = [
-        sfile.name for sfile in submissions_path.glob('*.py')]
+    index = submissions_index.load_submissions_index(submissions_path)
+    submissions_names = submissions_index.get_submissions_names(index)
     not_fullmark_submissions = set()
-    # TODO: Improve performance
     for student in not_fullmark_students:
-        for submission_name in all_submissions_names:
-            if student in submission_name:
-                not_fullmark_submissions.add(
-                    '.'.join(submission_name.split('.')[0:-1]))
+        not_fullmark_submissions.update(submissions_index.find_submissions(index, student, submissions_names))
     return list(not_fullmark_submissions)
 
 def get_lab_guide_content(course, lab):
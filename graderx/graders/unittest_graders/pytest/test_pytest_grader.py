@@ -0,0 +1,182 @@
+from . import pytest_grader
+from .lib import pytest_sharding, results_report, submissions_index
+import os
+import re
+
+
+LAB_TESTS = """
+import pytest
+
+SUBMISSIONS = ["1111", "2222", "3333", "4444", "5555"]
+
+
+@pytest.mark.parametrize("submission", SUBMISSIONS)
+def test_output(submission):
+    assert submission != "3333"
+
+
+@pytest.mark.parametrize("submission", SUBMISSIONS)
+def test_exit_code(submission):
+    pass
+"""
+
+
+def test_shards_split_the_keys_between_them():
+    keys = ["c", "a", "b", "a", "d", "e"]
+    shards = [pytest_sharding.select_shard(keys, shard_index, 2) for shard_index in range(2)]
+    assert shards == [{"a", "c", "e"}, {"b", "d"}]
+
+
+def test_the_tests_of_a_submission_are_kept_in_the_same_shard(tmp_path, monkeypatch):
+    lab_path = tmp_path.joinpath("lab1")
+    lab_path.mkdir()
+    lab_path.joinpath("test_run_grader.py").write_text("""
+import pytest
+
+SUBMISSIONS = ["submissions/1111.py", "submissions/2222.py", "submissions/3333.py"]
+
+
+@pytest.mark.parametrize("submission", SUBMISSIONS)
+@pytest.mark.parametrize("case", ["a", "b", "c"])
+def test_case(submission, case):
+    pass
+""")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("GRADERX_FJ", raising=False)
+    pytest_grader.run_shards(lab_path, False, 2, "output.txt", "results.ndjson")
+    shards = []
+    for line in tmp_path.joinpath("output.txt").read_text().splitlines():
+        if line.startswith("=") and "test session starts" in line:
+            shards.append(set())
+        match = re.search(r"\[[a-c]-submissions/(\d+)\.py\] PASSED", line)
+        if match:
+            shards[-1].add(match.group(1))
+    assert shards == [{"1111", "3333"}, {"2222"}]
+
+
+def test_run_shards_merges_the_outputs_in_shard_order(tmp_path, monkeypatch):
+    lab_path = tmp_path.joinpath("lab1")
+    lab_path.mkdir()
+    lab_path.joinpath("test_run_grader.py").write_text(LAB_TESTS)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("GRADERX_FJ", raising=False)
+    progress_calls = []
+    pytest_grader.run_shards(
+        lab_path, False, 2, "output.txt", "results.ndjson", lambda *args: progress_calls.append(args), 5)
+
+    output = tmp_path.joinpath("output.txt").read_text()
+    results = re.findall(r"::(\w+)\[(\d+)\] (PASSED|FAILED)", output)
+    assert sorted(results) == sorted(
+        [(test, submission, "FAILED" if (test, submission) == ("test_output", "3333") else "PASSED")
+         for test in ("test_output", "test_exit_code") for submission in ("1111", "2222", "3333", "4444", "5555")])
+    # Every submission is graded by a single shard, the first shard's submissions come first
+    assert [submission for _, submission, _ in results] == \
+        ["1111", "3333", "5555", "1111", "3333", "5555", "2222", "4444", "2222", "4444"]
+    assert progress_calls == [(2, 5)]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["lab1", "output.txt", "results.ndjson"]
+
+    results = results_report.read_test_results([tmp_path.joinpath("results.ndjson")])
+    assert list(results) == ["1111", "3333", "5555", "2222", "4444"]
+    assert list(results["3333"]) == ["test_output", "test_exit_code"]
+    assert results["3333"]["test_output"]["outcome"] == "failed"
+    assert "assert '3333' != '3333'" in results["3333"]["test_output"]["tracebacks"][0]
+    assert results["1111"]["test_output"] == {
+        "outcome": "passed", "duration": results["1111"]["test_output"]["duration"], "tracebacks": []}
+
+
+def test_write_reports(tmp_path):
+    passed = {"outcome": "passed", "duration": 0.5, "tracebacks": []}
+    failed = {"outcome": "failed", "duration": 1.25, "tracebacks": ["assert 1 == 2"]}
+    skipped = {"outcome": "skipped", "duration": 0, "tracebacks": []}
+    results = {
+        "2222": {"test_output": passed, "test_exit_code": failed, "test_extra": skipped},
+        "1111": {"test_output": passed, "test_exit_code": passed}
+    }
+    reports_path = tmp_path.joinpath("res/lab1")
+    results_report.write_reports(results, reports_path, "lab1")
+
+    assert reports_path.joinpath("lab1_grade_summary.csv").read_text().splitlines() == ["1111,1.0", "2222,0.5"]
+    assert [row["id"] for row in pytest_grader.iter_grades_file(
+        open(reports_path.joinpath("lab1_grade_summary.csv")))] == ["1111", "2222"]
+    assert reports_path.joinpath("lab1_report.csv").read_text().splitlines() == [
+        "submission,test_output,test_exit_code,test_extra,grade",
+        "1111,PASSED,PASSED,,1.0",
+        "2222,PASSED,FAILED,SKIPPED,0.5"]
+    assert reports_path.joinpath("lab1_short_crash_summary.txt").read_text() == \
+        "2222 test_exit_code FAILED 1.25s\n"
+    assert "assert 1 == 2" in reports_path.joinpath("lab1_crash_details.txt").read_text()
+
+
+def test_run_grader_cleans_its_scratch_directory(tmp_path, monkeypatch):
+    course_path = tmp_path.joinpath("course")
+    course_path.joinpath("lib").mkdir(parents=True)
+    course_path.joinpath("lib/app_config.py").write_text("YEAR = 2026\n")
+    lab_path = course_path.joinpath("lab1")
+    lab_path.joinpath("submissions/2026").mkdir(parents=True)
+    for submission in ("1111", "2222", "3333", "4444", "5555"):
+        lab_path.joinpath(f"submissions/2026/{submission}.py").write_text("")
+    lab_path.joinpath("test_run_grader.py").write_text(LAB_TESTS + """
+
+def test_writes_a_relative_path():
+    open("relative_path.txt", "w").close()
+""")
+    scratch_path = tmp_path.joinpath("scratch")
+    scratch_path.mkdir()
+    monkeypatch.setattr(pytest_grader, "get_course_root", lambda course: course_path)
+    monkeypatch.setattr(pytest_grader, "GRADING_SCRATCH_PATH", str(scratch_path))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("GRADERX_FJ", raising=False)
+    pytest_grader.run_grader("course", "lab1", workers=2)
+
+    assert list(scratch_path.iterdir()) == []
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["course", "scratch"]
+    assert [(row["id"], row["grade"]) for row in pytest_grader.get_grades("course", "lab1")] == \
+        [("1111", 100.0), ("2222", 100.0), ("3333", 50.0), ("4444", 100.0), ("5555", 100.0)]
+
+
+def test_courses_with_a_console_log_parser_keep_using_it(tmp_path):
+    tmp_path.joinpath("lib").mkdir()
+    course_config = type("app_config", (), {"YEAR": 2026})
+    assert not pytest_grader.uses_console_log_parser(tmp_path, course_config)
+    tmp_path.joinpath("lib/console_log_parser.py").write_text("")
+    assert pytest_grader.uses_console_log_parser(tmp_path, course_config)
+    course_config.STRUCTURED_RESULTS = True
+    assert not pytest_grader.uses_console_log_parser(tmp_path, course_config)
+
+
+def test_course_config_is_reloaded_only_when_it_changes(tmp_path, monkeypatch):
+    tmp_path.joinpath("lib").mkdir()
+    app_config_path = tmp_path.joinpath("lib/app_config.py")
+    app_config_path.write_text("YEAR = 2025\n")
+    monkeypatch.setattr(pytest_grader, "get_course_root", lambda course: tmp_path)
+    course_config = pytest_grader.get_course_config("course")
+    assert pytest_grader.get_course_config("course") is course_config
+    assert pytest_grader.get_course_year("course") == 2025
+
+    app_config_path.write_text("YEAR = 2026  \n")
+    assert pytest_grader.get_course_config("course") is not course_config
+    assert pytest_grader.get_course_year("course") == 2026
+
+
+def test_not_fullmark_submissions_are_found_using_the_index(tmp_path, monkeypatch):
+    tmp_path.joinpath("lib").mkdir()
+    tmp_path.joinpath("lib/app_config.py").write_text("YEAR = 2026\n")
+    submissions_path = tmp_path.joinpath("lab1/submissions/2026")
+    submissions_path.mkdir(parents=True)
+    for submission in ("2136_2315", "1111", "lab1_s4444"):
+        submissions_path.joinpath(f"{submission}.py").write_text("")
+    tmp_path.joinpath("res/lab1").mkdir(parents=True)
+    tmp_path.joinpath("res/lab1/lab1_grade_summary.csv").write_text("2315,0.5\n1111,1.0\ns4444,0.25\n")
+    monkeypatch.setattr(pytest_grader, "get_course_root", lambda course: tmp_path)
+    assert sorted(pytest_grader.get_not_fullmark_submissions("course", "lab1")) == ["2136_2315", "lab1_s4444"]
+    index = submissions_index.load_submissions_index(submissions_path)
+    assert index["submissions"]["2136"] == ["2136_2315"]
+    assert index["submissions"]["s4444"] == ["lab1_s4444"]
+    assert submissions_index.find_submissions(index, "s444", ["1111", "2136_2315", "lab1_s4444"]) == ["lab1_s4444"]
+
+    # Submissions added after the index was built are indexed when it's used again
+    submissions_path.joinpath("3333.py").write_text("")
+    # The directory's modification time may not change within the filesystem's timestamp granularity
+    os.utime(submissions_path, ns=(index["mtime"] + 10 ** 9, index["mtime"] + 10 ** 9))
+    tmp_path.joinpath("res/lab1/lab1_grade_summary.csv").write_text("3333,0\n")
+    assert pytest_grader.get_not_fullmark_submissions("course", "lab1") == ["3333"]
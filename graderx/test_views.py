@@ -8,6 +8,8 @@ import string
 from pathlib import Path
 import flask
 from io import BytesIO
+import time
+import json
 
 
 def generate_random_code():
@@ -107,3 +109,58 @@ def test_status_successful_grading(monkeypatch, client):
                      content_type='multipart/form-data',
                      data={'submissions_file': (BytesIO(b'my file contents'), 'myfile.rar')})
     assert rv.json['status'] == views.UPLOAD_STATUS.SUCCESS.value
+
+
+def test_run_grader_queues_a_job_that_can_be_polled(monkeypatch, client):
+    def mock_run_grader(course_name, lab, student=False, progress=None):
+        progress(1, 2)
+        progress(2, 2)
+
+    monkeypatch.setattr(manager, "run_grader", mock_run_grader)
+    rv = client.get("/run_grader?course=test_course&lab=lab1")
+    assert rv.status_code == 202
+    job_id = rv.json['job_id']
+    for _ in range(100):
+        rv = client.get(f"/jobs/{job_id}")
+        assert rv.status_code == 200
+        if rv.json['status'] in ("done", "failed"):
+            break
+        time.sleep(0.05)
+    assert rv.json['status'] == "done" and rv.json['done'] == 2 and rv.json['total'] == 2
+
+
+def test_unknown_job_is_not_found(client):
+    rv = client.get(f"/jobs/{generate_random_code()}")
+    assert rv.status_code == 404
+
+
+def test_test_cases_are_paginated_with_byte_ranges(monkeypatch, client, tmp_path):
+    test_cases_path = tmp_path.joinpath("test_cases")
+    test_cases_path.mkdir()
+    for tc_id in range(1, 13):
+        test_cases_path.joinpath(f"{tc_id}_in").write_text(f"input {tc_id}")
+        test_cases_path.joinpath(f"{tc_id}_out").write_text(f"output {tc_id}")
+    monkeypatch.setattr(manager.stdout_common, "get_lab_path", lambda course, lab: tmp_path)
+    rv = client.get("/courses/test_course/labs/lab1/test_cases?offset=10&limit=5&start=2&length=3")
+    assert rv.status_code == 200 and rv.json['total'] == 12
+    assert [(tc['id'], tc['input'], tc['output'], tc['input_size']) for tc in rv.json['test_cases']] == [
+        ("11", "put", "tpu", 8), ("12", "put", "tpu", 8)]
+    rv = client.get("/courses/test_course/labs/lab1/test_cases?limit=0")
+    assert rv.status_code == 400
+    labs = client.get("/courses/test_course/labs?summary").json['labs']
+    lab1 = next(lab for lab in labs if lab['name'] == "lab1")
+    assert 'test_cases' not in lab1
+    assert lab1['test_cases_summary'] == {"count": 12, "input_size": 87, "output_size": 99}
+
+
+def test_grades_are_streamed_as_csv_or_ndjson(monkeypatch, client):
+    rows = [dict(dict.fromkeys(manager.GRADES_COLUMNS, 1), id="1111", failed_ids="2 3")]
+    samples = []
+    monkeypatch.setattr(manager, "get_grades", lambda course, lab, sample: samples.append(sample) or iter(rows))
+    rv = client.get("/results?course=test_course&lab=lab1&type=grades")
+    assert rv.status_code == 200 and rv.mimetype == "text/csv"
+    assert rv.get_data(as_text=True).splitlines() == [
+        ",".join(manager.GRADES_COLUMNS), "1111,1,1,1,2 3,1,1,1"]
+    rv = client.get("/results?course=test_course&lab=lab1&type=grades&format=ndjson&sample")
+    assert [json.loads(line) for line in rv.get_data(as_text=True).splitlines()] == rows
+    assert samples == [False, True]
@@ -1,11 +1,16 @@
 from graderx import app
 from graderx.graders import manager
-from flask import request, jsonify, send_file
+from flask import request, jsonify, send_file, Response
 from enum import Enum
+import csv
+import io
+import json
 from graderx.graders import import_submissions
 
 
 ALLOWED_EXTENSIONS = {'rar', '7z', 'zip'}
+# Query parameters of /results?type=diff that select a page of the diff results instead of all of them
+DIFF_PAGE_PARAMS = ('offset', 'limit', 'submission_id', 'tc_id', 'metadata_only')
 
 
 def allowed_file(filename):
@@ -80,14 +85,45 @@ def get_labs(course_name):
     Responds with with a list of labs for the specified course
     Example:GET /courses/cc451/labs
     Response body: {"labs": ["lab1_client", "lab1_server", "lab3", "lab4"]}
+    > GET /courses/cc451/labs?summary
+    responds with the count and total sizes of every lab's test cases instead of their content
     """
     try:
-        labs = manager.get_all_labs_data(course_name)
+        labs = manager.get_all_labs_data(course_name, summary='summary' in request.args)
         return jsonify({"labs": labs})
     except manager.CourseNotFoundError:
         return jsonify({"message": "Course Not Found"}), 404
 
 
+@app.route('/courses/<course_name>/labs/<lab_id>/test_cases')
+def get_test_cases(course_name, lab_id):
+    """
+    Responds with a page of the lab's test cases, takes the optional query parameters
+    "offset" and "limit" (at most 100) to select the test cases,
+    "start" and "length" to select the bytes of every input and output that are sent
+    Example:GET /courses/cc451/labs/lab3/test_cases?offset=20&limit=10&start=0&length=4096
+    Response body: {"test_cases": [{"id": "21", "input": "...", "input_size": 10240,
+                    "output": "...", "output_size": 512}, ...], "total": 45, "offset": 20, "limit": 10}
+    """
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', 20))
+        start = int(request.args.get('start', 0))
+        length = int(request.args['length']) if 'length' in request.args else None
+    except ValueError:
+        return jsonify({"message": "offset, limit, start and length must be integers"}), 400
+    if offset < 0 or not 0 < limit <= 100 or start < 0 or (length is not None and length < 0):
+        return jsonify({"message": "Invalid test cases range"}), 400
+    try:
+        return jsonify(manager.get_test_cases_page(course_name, lab_id, offset, limit, start, length))
+    except manager.CourseNotFoundError:
+        return jsonify({"message": "Course Not Found"}), 404
+    except manager.LabNotFoundError:
+        return jsonify({"message": "Lab not found"}), 404
+    except:
+        return jsonify({"message": "An error occured"}), 500
+
+
 @app.route('/courses/<course_name>/labs/<lab_id>/lab_guide')
 def get_lab_guide(course_name, lab_id):
     try:
@@ -150,27 +186,96 @@ def delete_lab(course_name, lab_id):
 @app.route('/run_grader')
 def start_grading():
     """
-    Takes 2 query parameters "course" and "lab", then calls the run_grader of the manager
-    which determine the corresponding grader to run
+    Takes 2 query parameters "course" and "lab", then queues a grading job in the manager
+    which determine the corresponding grader to run, responds immediately with the job id
+    that can be polled through GET /jobs/<job_id>
     Example:GET /run_grader?course=cc451&lab=lab3
+    Response body: {"message": "SUCCESS", "job_id": "9f0c6b1e..."}
+    > GET /run_grader?course=test_course&lab=lab1&incremental
+    only re-runs the submissions and test cases that changed since the last grading of the lab
+    > GET /run_grader?course=test_course&lab=lab1&fail_fast
+    stops running a submission's test cases after its first failing one
+    > GET /run_grader?course=test_course&lab=lab1&sample_submissions=20&sample_test_cases=5&seed=42
+    only grades 20 random submissions against 5 random test cases, the same seed picks the same sample,
+    its results are read with GET /results?sample
     """
     try:
         course_name = request.args['course']
         lab_name = request.args['lab']
     except KeyError:
         return jsonify({"message": "course and lab query parameters must be included"}), 400
+    options = {}
+    if 'incremental' in request.args:
+        options['incremental'] = True
+    if 'fail_fast' in request.args:
+        options['fail_fast'] = True
+    try:
+        for option, param in (('sample_submissions', 'sample_submissions'), ('sample_test_cases', 'sample_test_cases'),
+                              ('sample_seed', 'seed')):
+            if param in request.args:
+                options[option] = int(request.args[param])
+    except ValueError:
+        return jsonify({"message": "sample_submissions, sample_test_cases and seed must be integers"}), 400
+    if options.get('sample_submissions', 1) < 1 or options.get('sample_test_cases', 1) < 1:
+        return jsonify({"message": "sample sizes must be positive"}), 400
     try:
         if 'student' in request.args:
-            manager.run_grader(course_name, lab_name, student=True)
+            job_id = manager.start_grading_job(course_name, lab_name, student=True, **options)
         else:
-            manager.run_grader(course_name, lab_name)
-        return jsonify({"message": "SUCCESS"}), 200
+            job_id = manager.start_grading_job(course_name, lab_name, **options)
+        return jsonify({"message": "SUCCESS", "job_id": job_id}), 202
+    except manager.CourseNotFoundError:
+        return jsonify({"message": "Course Not Found"}), 404
+    except manager.LabNotFoundError:
+        return jsonify({"message": "Lab not found"}), 404
+    except manager.NoPublicTestcasesError:
+        return jsonify({"message": "This lab does not have public test cases"}), 400
+    except manager.UnsupportedGradingOptionsError:
+        return jsonify({"message": "The lab's grader does not support these options"}), 400
     except:
         return jsonify({
             "message": "Failed to run the grader"
         }), 500
 
 
+@app.route('/jobs')
+def get_grading_jobs():
+    """
+    Responds with the status of the grading jobs, optionally filtered by the "course" and "lab" query parameters
+    Example:GET /jobs?course=cc451&lab=lab3
+    """
+    return jsonify({"jobs": manager.get_grading_jobs(request.args.get('course'), request.args.get('lab'))})
+
+
+@app.route('/jobs/<job_id>')
+def get_grading_job(job_id):
+    """
+    Responds with the status of a grading job, the number of graded submissions out of the total,
+    the elapsed time and the estimated remaining time in seconds
+    Example:GET /jobs/9f0c6b1e...
+    Response body: {"id": "9f0c6b1e...", "course": "cc451", "lab": "lab3", "student": false, "options": {},
+                    "status": "running",
+                    "done": 120, "total": 300, "elapsed": 60.5, "eta": 90.75, "error": null}
+    """
+    try:
+        return jsonify(manager.get_grading_job(job_id))
+    except manager.GradingJobNotFoundError:
+        return jsonify({"message": "Job not found"}), 404
+
+
+@app.route('/stats')
+def get_stats():
+    """
+    Responds with the usage statistics of the graders' caches
+    Example:GET /stats
+    Response body: {"compile_cache": {"enabled": true, "hits": 250, "misses": 50, "hit_rate": 0.8333,
+                    "entries": 50, "size": 845000, "max_size": 536870912},
+                    "test_cases_cache": {"hits": 40, "misses": 2, "hit_rate": 0.9524,
+                    "entries": 2, "size": 20480, "max_size": 268435456}}
+    """
+    return jsonify(manager.get_cache_stats())
+
+
 @app.route('/submissions', methods=['POST'])
 def add_submissions():
     # TODO: REFACTOR THIS!!!!!
@@ -320,6 +425,16 @@ def get_results():
     > GET /results?course=cc451&lab=lab3&type=json
     will send the results in the response body as a json object so that it can be easily parsed and used
     in the client side
+    > GET /results?course=cc451&lab=lab3&type=diff&offset=0&limit=20&tc_id=4&metadata_only
+    sends a page of the diff results, "submission_id" and "tc_id" filter the submissions and "metadata_only"
+    replaces the outputs of the failed test cases with their sizes, they're fetched with GET /results/failed_case
+    > GET /results?course=cc451&lab=lab3&type=clusters&tc_id=4
+    sends the submissions that failed every test case (or only "tc_id") grouped by their identical wrong outputs
+    > GET /results?course=cc451&lab=lab3&type=grades&format=ndjson
+    streams a row for every submission with its grade, passed count, failed test cases ids and runtime stats,
+    "format" is either csv (the default) or ndjson
+    > GET /results?course=cc451&lab=lab3&type=diff&sample
+    "sample" selects the results of the lab's last sampled run (see /run_grader) instead of its last full run
     """
     try:
         course_name = request.args['course']
@@ -327,18 +442,67 @@ def get_results():
         results_type = request.args['type']
     except KeyError:
         return jsonify({"message": "course, lab and type query parameters must be included"}), 400
+    sample = 'sample' in request.args
 
     if results_type == "download":
         try:
-            return send_file(manager.compressed_results(course_name, lab_name))
+            return send_file(manager.compressed_results(course_name, lab_name, sample))
         except:
             return jsonify({
                 "message": "Failed to fetch results, please make sure you run the grader first"
             }), 400
 
+    elif results_type == "grades":
+        grades_format = request.args.get('format', 'csv')
+        if grades_format not in ('csv', 'ndjson'):
+            return jsonify({"message": "format must be either csv or ndjson"}), 400
+        try:
+            grades = manager.get_grades(course_name, lab_name, sample)
+        except manager.CourseNotFoundError:
+            return jsonify({"message": "Course Not Found"}), 404
+        except manager.ResultsNotFoundError:
+            return jsonify({
+                "message": "Failed to fetch grades, please make sure you run the grader first"
+            }), 400
+        if grades_format == 'ndjson':
+            return Response((json.dumps(row) + '\n' for row in grades), mimetype='application/x-ndjson')
+        return Response(stream_csv(grades, manager.GRADES_COLUMNS), mimetype='text/csv',
+                        headers={"Content-Disposition": f"attachment; filename={lab_name}_grades.csv"})
+
+    elif results_type == "clusters":
+        try:
+            return jsonify(manager.get_failure_clusters(course_name, lab_name, request.args.get('tc_id'), sample)), 200
+        except manager.CourseNotFoundError:
+            return jsonify({"message": "Course Not Found"}), 404
+        except manager.ResultsNotFoundError:
+            return jsonify({
+                "message": "Failed to fetch diff results, please make sure you run the grader first"
+            }), 400
+        except:
+            return jsonify({"message": "An error occured"}), 500
+
+    elif results_type == "diff" and any(param in request.args for param in DIFF_PAGE_PARAMS):
+        try:
+            offset = int(request.args.get('offset', 0))
+            limit = int(request.args.get('limit', 20))
+        except ValueError:
+            return jsonify({"message": "offset and limit must be integers"}), 400
+        if offset < 0 or not 0 < limit <= 100:
+            return jsonify({"message": "Invalid diff results range"}), 400
+        try:
+            return jsonify(manager.get_diff_page(
+                course_name, lab_name, offset, limit, request.args.get('submission_id'), request.args.get('tc_id'),
+                'metadata_only' in request.args, sample)), 200
+        except manager.ResultsNotFoundError:
+            return jsonify({
+                "message": "Failed to fetch diff results, please make sure you run the grader first"
+            }), 400
+        except:
+            return jsonify({"message": "An error occured"}), 500
+
     elif results_type == "diff":
         try:
-            return jsonify(manager.run_grader_diff(course_name, lab_name)), 200
+            return jsonify(manager.run_grader_diff(course_name, lab_name, sample)), 200
             # return jsonify(manager.get_diff_results_file(course_name, lab_name)), 200
         except:
             return jsonify({
@@ -350,6 +514,53 @@ def get_results():
         }), 500
 
 
+@app.route('/results/failed_case')
+def get_failed_case():
+    """
+    Takes 4 query parameters "course", "lab", "submission_id" and "tc_id",
+    responds with the output and the expected output of the submission's failed test case,
+    "sample" reads it from the results of the lab's last sampled run
+    Example:GET /results/failed_case?course=cc451&lab=lab3&submission_id=3245_3213&tc_id=4
+    Response body: {"tc_id": "4", "output": "...", "expected": "..."}
+    """
+    try:
+        course_name = request.args['course']
+        lab_name = request.args['lab']
+        submission_id = request.args['submission_id']
+        tc_id = request.args['tc_id']
+    except KeyError:
+        return jsonify({"message": "course, lab, submission_id and tc_id query parameters must be included"}), 400
+    try:
+        return jsonify(manager.get_failed_case(course_name, lab_name, submission_id, tc_id, 'sample' in request.args))
+    except manager.CourseNotFoundError:
+        return jsonify({"message": "Course Not Found"}), 404
+    except manager.FailedCaseNotFoundError:
+        return jsonify({"message": "Failed test case not found"}), 404
+    except manager.ResultsNotFoundError:
+        return jsonify({
+            "message": "Failed to fetch diff results, please make sure you run the grader first"
+        }), 400
+    except:
+        return jsonify({"message": "An error occured"}), 500
+
+
+def stream_csv(rows, columns):
+    """
+    Yields the csv header then the csv line of every row (a dict with the columns as keys) one at a time
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns)
+    writer.writeheader()
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
 @app.route('/submissions/validate', methods=['POST'])
 def validate_import_source():
     """